@@ -1,4 +1,6 @@
-from .rootplots import tex
-from .rootplots.save import *
-from .rootplots import bins
-from .rootplots import utils
+from importlib import import_module
+
+
+def __getattr__(name):
+    """ forwards to the rootplots package, which imports its submodules on first access """
+    return getattr(import_module('.rootplots', __name__), name)
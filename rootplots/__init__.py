@@ -1,6 +1,28 @@
-from . import binning as bins
-from .draw import *
-from .save import *
-from . import latex as tex
+import ast as _ast
+from importlib import import_module as _import
+from pathlib import Path as _Path
 
 __version__ = '1.0'
+
+Modules = {'bins': 'binning', 'tex': 'latex'}  # aliases of the submodules
+Exports = {'draw': None, 'save': None}  # submodules whose __all__ is available on the package, read on first access
+
+
+def _exports(module):
+    """ :returns: the __all__ list declared in [module], read from the source so that looking up a name does not import ROOT """
+    if Exports[module] is None:
+        tree = _ast.parse(_Path(__file__).with_name(f'{module}.py').read_text())
+        Exports[module] = next(_ast.literal_eval(n.value) for n in tree.body if isinstance(n, _ast.Assign) and any(getattr(t, 'id', None) == '__all__' for t in n.targets))
+    return Exports[module]
+
+
+def __getattr__(name):
+    """ imports the submodules only on first access, so that importing the package does not load ROOT """
+    if name == '__all__':  # star imports still provide the names of draw and save, which are only imported then
+        return list(Modules) + [n for m in Exports for n in _exports(m)]
+    if name in Modules or _Path(__file__).with_name(f'{name}.py').exists():
+        return _import(f'.{Modules.get(name, name)}', __name__)
+    for m in Exports:
+        if name in _exports(m):
+            return getattr(_import(f'.{m}', __name__), name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
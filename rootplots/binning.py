@@ -2,22 +2,37 @@
 #       Functions for binning histograms
 # created on January 12th 2023 by M. Reichmann
 # --------------------------------------------------------
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+from hashlib import blake2b
+from os import stat
+
 import numpy as np
 
-from .utils import choose, ufloat, is_iter, mean_sigma
+from . import cpp
+from .utils import choose, is_iter, arr2u, uarr2n, uarr2s, Prof
+
+
+ShardSize = 10 ** 6  # minimum number of entries per shard for parallel binning
+Types = {'C': 'i1', 'S': 'i2', 'I': 'i4', 'L': 'i8', 'F': 'f4', 'D': 'f8'}  # last letter of the ROOT class name -> dtype of the content buffer
 
 
 def freedman_diaconis(x):
-    return 2 * (np.quantile(x, .75) - np.quantile(x, .25)) / x.size ** (1 / 3)
+    x = summarise(x)
+    q25, q75 = quantiles(x, [.25, .75])
+    return 2 * (q75 - q25) / size(x) ** (1 / 3)
 
 
 def width(x):
-    w = freedman_diaconis(x[np.isfinite(x)])
-    return w if w else 3.49 * mean_sigma(x)[1].n / x.size ** (1 / 3)
+    x = summarise(x)
+    w = freedman_diaconis(x)
+    return w if w else 3.49 * std(x) / size(x) ** (1 / 3)
 
 
 def n(x):
-    return int((x.max() - x.min()) / width(x))
+    x = summarise(x)
+    return int(np.diff(quantiles(x, [0, 1]))[0] / width(x))
 
 
 def increase_range(low, high, fl, fh, to_int=False):
@@ -28,7 +43,7 @@ def increase_range(low, high, fl, fh, to_int=False):
 
 
 def entries(h):
-    return np.array([h.GetBinEntries(i) for i in range(1, h.GetNbinsX() + 1)], 'i')
+    return bin_entries(h)[1:-1].astype('i')
 
 
 def single_entries_2d(h, ix, iy, nx):
@@ -36,13 +51,13 @@ def single_entries_2d(h, ix, iy, nx):
 
 
 def entries_2d(h, flat=False):
-    nx, ny = h.GetNbinsX(), h.GetNbinsY()
-    e = np.array([[single_entries_2d(h, ix, iy, nx) for ix in range(1, nx + 1)] for iy in range(1, ny + 1)], 'i')
+    e = (bin_entries(h) if 'Prof' in h.ClassName() else content(h)).reshape(h.GetNbinsY() + 2, h.GetNbinsX() + 2)[1:-1, 1:-1].astype('i')
     return e.flatten() if flat else e
 
 
 def from_uvec(x):
-    return [x.size, np.append([i.n - i.s for i in x], x[-1].n + x[-1].s).astype('d')]
+    n, s = uarr2n(x), uarr2s(x)
+    return [n.size, np.append(n - s, n[-1] + s[-1]).astype('d')]
 
 
 def from_vec(x, centre=False):
@@ -74,16 +89,165 @@ def make2d(x, y, wx=1, wy=1, nx=None, ny=None, last=True):
     return make(*x, wx, last, nx) + make(*y, wy, last, ny)
 
 
+# ----------------------------------------
+# region QUANTILES
+NExact = 10 ** 7  # arrays with more values are summarised by a QuantileSketch
+CacheSize = 32
+Cache = OrderedDict()  # hash of the array content -> statistics of its finite values, the least recently used are dropped
+
+
+class QuantileSketch(object):
+    """ Approximate quantiles of a stream of values from a uniform random sample of fixed size (the values with the smallest random keys).
+        The number of finite values, the minimum and the maximum are exact. """
+
+    Chunk = 2 ** 22
+
+    def __init__(self, size=10 ** 6, seed=0):
+        self.Size = int(size)
+        self.RNG = np.random.default_rng(seed)
+        self.Keys, self.Values = np.empty(0), np.empty(0)
+        self.N, self.Min, self.Max = 0, np.inf, -np.inf
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}: {self.N} values in [{self.Min}, {self.Max}], sample of {self.Values.size}'
+
+    @classmethod
+    def from_array(cls, x, size=10 ** 6, seed=0):
+        return cls(size, seed).update(x)
+
+    def update(self, x):
+        """ adds the values of [x] chunk by chunk. Only the values which enter the sample are drawn, so full chunks cost a single pass for the extrema. """
+        x = np.asarray(x).ravel()
+        for i in range(0, x.size, QuantileSketch.Chunk):
+            self.add(x[i:i + QuantileSketch.Chunk])
+        return self
+
+    def add(self, x):
+        x = x[np.isfinite(x)].astype('d', copy=False)
+        if not x.size:
+            return
+        self.N, self.Min, self.Max = self.N + x.size, min(self.Min, x.min()), max(self.Max, x.max())
+        t = self.Keys.max() if self.Keys.size == self.Size else 1.  # only keys below the largest key in the sample are kept
+        k = x.size if t == 1 else self.RNG.binomial(x.size, t)
+        v = x if k == x.size else x[self.RNG.choice(x.size, k, replace=False)]
+        keys, values = np.append(self.Keys, self.RNG.uniform(0, t, k)), np.append(self.Values, v)
+        i = np.argpartition(keys, self.Size)[:self.Size] if keys.size > self.Size else slice(None)
+        self.Keys, self.Values = keys[i], values[i]
+
+    def quantile(self, q):
+        q = np.asarray(q, 'd')
+        return np.where(q == 0, self.Min, np.where(q == 1, self.Max, np.quantile(self.Values, q))) if self.N else np.full(q.shape, np.nan)
+
+    @property
+    def size(self):
+        return self.N
+
+    @property
+    def std(self):
+        return self.Values.std(ddof=1) if self.Values.size > 1 else 0.
+
+
+class Summary(object):
+    """ array with its cached statistics, which are looked up only once per binning """
+
+    def __init__(self, x, cache):
+        self.X, self.Cache = x, cache
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}: {self.X.size} values, cached {[*self.Cache]}'
+
+
+def content_key(x):
+    """ :returns: hash of the shape, type and values of the array [x]. Read-only memory maps are identified by their file and position instead of reading them again. """
+    k = blake2b(f'{x.shape}{x.dtype.str}{x.strides}'.encode(), digest_size=16)
+    if isinstance(x, np.memmap) and x.filename is not None and not x.flags.writeable:
+        f = stat(x.filename)
+        k.update(f'{x.filename}{f.st_size}{f.st_mtime_ns}{x.__array_interface__["data"][0]}'.encode())
+    else:
+        k.update(np.ascontiguousarray(x).data)
+    return k.hexdigest()
+
+
+def stats(x):
+    """ :returns: the cached statistics of the array [x], keyed by its content, so that in-place modifications are never served stale values """
+    key = content_key(x)
+    if key not in Cache:
+        Cache[key] = {}
+        while len(Cache) > CacheSize:
+            Cache.popitem(last=False)
+    Cache.move_to_end(key)
+    return Cache[key]
+
+
+def clear_cache():
+    Cache.clear()
+
+
+def summarise(x):
+    """ :returns: Summary of the array [x] with its cached statistics, or its cached QuantileSketch if it has more than NExact values.
+        The cache is only looked up (and the array hashed) if [x] is not yet summarised, so summarise once and pass the result to the other functions. """
+    if isinstance(x, (QuantileSketch, Summary)):
+        return x
+    x = np.asarray(x)
+    s = stats(x)
+    if x.size > NExact:
+        s['sketch'] = s['sketch'] if 'sketch' in s else QuantileSketch.from_array(x)
+        return s['sketch']
+    return Summary(x, s)
+
+
+def finite(x):
+    return x[np.isfinite(x)]
+
+
+def quantiles(x, q):
+    """ :returns: the quantiles [q] of the finite values of [x]. All uncached quantiles are evaluated in a single partition pass (or from the sketch of a large array). """
+    x = summarise(x)
+    if isinstance(x, QuantileSketch):
+        return x.quantile(q)
+    c, q = x.Cache, np.atleast_1d(q).astype('d')
+    new = [i for i in q if i not in c]
+    if new:
+        v = finite(x.X)
+        c.update(zip(new, np.quantile(v, new) if v.size else np.full(len(new), np.nan)))
+    return np.array([c[i] for i in q])
+
+
+def size(x):
+    """ :returns: number of finite values in [x] """
+    x = summarise(x)
+    if isinstance(x, QuantileSketch):
+        return x.size
+    c = x.Cache
+    c['n'] = c['n'] if 'n' in c else np.count_nonzero(np.isfinite(x.X))
+    return c['n']
+
+
+def std(x):
+    x = summarise(x)
+    if isinstance(x, QuantileSketch):
+        return x.std
+    c = x.Cache
+    c['std'] = c['std'] if 'std' in c else finite(x.X).std(ddof=1)
+    return c['std']
+# endregion QUANTILES
+# ----------------------------------------
+
+
 # ----------------------------------------
 # region FIND
 def find_range(values, lfac=.2, rfac=.2, q=.02, lq=None):
-    q = np.quantile(values[np.isfinite(values)], [choose(lq, q), 1 - q])
-    return increase_range(*[min(values), max(values)] if q[0] == q[1] else q, lfac, rfac)
+    xmin, xmax, *q = quantiles(values, [0, 1, choose(lq, q), 1 - q])
+    return increase_range(*[xmin, xmax] if q[0] == q[1] else q, lfac, rfac)
 
 
+@Prof.timed('binning')
 def find(values, lfac=.2, rfac=.2, q=.02, nbins=1, lq=None, w=None, x0=None, x1=None, r=None):
-    if np.all([values == values[0]]):
-        return [3, np.array([-.15, -.05, .05, 0.15], 'd') * values[0] + values[0]]
+    """ :returns: the binning of [values] (array or QuantileSketch) with the Freedman-Diaconis bin width [w] and the range from the quantiles [lq/q, 1 - q]. """
+    values = summarise(values)  # the statistics are looked up only once
+    xmin, xmax = quantiles(values, [0, 1, .25, .75, choose(lq, q), 1 - q])[:2]  # all quantiles of the binning in one pass
+    if xmin == xmax:
+        return [3, np.array([-.15, -.05, .05, 0.15], 'd') * xmin + xmin]
     w, (xmin, xmax) = choose(w, width(values) * nbins), find_range(values, lfac, rfac, q, lq) if r is None else np.array(r, 'd')
     bins = np.arange(choose(x0, xmin), choose(x1, xmax) + w, w, dtype='d')
     return [bins.size - 1, bins]
@@ -101,11 +265,21 @@ def hn(h, axis='X'):
     return range(1, getattr(h, f'GetNbins{axis}')() + 1)
 
 
+def edges(ax):
+    e = ax.GetXbins()
+    return np.frombuffer(e.GetArray(), count=e.GetSize()).copy() if e.GetSize() else np.linspace(ax.GetXmin(), ax.GetXmax(), ax.GetNbins() + 1)
+
+
 def from_hist(h, err=True, raw=False, axis='X'):
-    ax = getattr(h, f'Get{axis.title()}axis')()
+    e = edges(getattr(h, f'Get{axis.title()}axis')())
     if raw:
-        return np.array([ax.GetBinLowEdge(i) for i in range(1, ax.GetNbins() + 2)], 'd')
-    return np.array([ufloat(ax.GetBinCenter(ibin), ax.GetBinWidth(ibin) / 2) if err else ax.GetBinCenter(ibin) for ibin in range(1, ax.GetNbins() + 1)])
+        return e
+    c = (e[1:] + e[:-1]) / 2
+    return arr2u(c, np.diff(e) / 2) if err else c
+
+
+def hedges(h):
+    return [edges(getattr(h, f'Get{i}axis')()) for i in 'XYZ'[:h.GetDimension()]]
 
 
 def hx(h, err=True):
@@ -122,16 +296,117 @@ def h2d(h, arr=False):
 
 
 def h2dgrid(h):
-    x, y = [from_hist(h, err=False, raw=False, axis=ax) for ax in ['X', 'Y']]
-    return np.array([[ix, iy] for iy in y for ix in x]).T
+    x, y = np.meshgrid(*[from_hist(h, err=False, raw=False, axis=ax) for ax in ['X', 'Y']])
+    return np.array([x.flatten(), y.flatten()])
 
 
 def set_2d_values(h, arr):
-    [h.SetBinContent(ix + 1, iy + 1, arr[iy, ix]) for ix in range(arr.shape[1]) for iy in range(arr.shape[0])]
+    c, n = content(h).astype('d'), h.GetEntries()
+    c.reshape(h.GetNbinsY() + 2, h.GetNbinsX() + 2)[1:-1, 1:-1] = arr
+    h.SetContent(c)
+    h.SetEntries(n)
 
 
 def set_2d_entries(h, arr):
-    ny, nx = arr.shape
-    [h.SetBinEntries((nx + 2) * (iy + 1) + (ix + 1), arr[iy, ix]) for ix in range(nx) for iy in range(ny)]
+    e = bin_entries(h)
+    e.reshape(h.GetNbinsY() + 2, h.GetNbinsX() + 2)[1:-1, 1:-1] = arr
+    cpp.lib().set_entries(h, e)
 # endregion HISTOGRAM
 # ----------------------------------------
+
+
+# ----------------------------------------
+# region BUFFERS
+def dtype(h):
+    return 'f8' if 'Profile' in h.ClassName() else Types.get(h.ClassName()[-1], 'f8')
+
+
+def content(h):
+    """ :returns: zero-copy view of the content of all cells (including under- and overflow) of [h]. Only valid as long as [h] exists! """
+    return np.frombuffer(h.GetArray(), dtype(h), count=h.GetNcells())
+
+
+def sumw2(h):
+    return np.frombuffer(h.GetSumw2().GetArray(), count=h.GetNcells()) if h.GetSumw2N() else None
+
+
+def bin_entries(h):
+    e = np.zeros(h.GetNcells())
+    cpp.lib().get_entries(h, e)
+    return e
+
+
+def bin_sumw2(h):
+    s = h.GetBinSumw2()
+    return np.frombuffer(s.GetArray(), count=h.GetNcells()) if s.GetSize() else None
+
+
+def buffers(h):
+    """ :returns: the buffers [content, sumw2, bin entries, bin sumw2] of all cells of [h], the last two only exist for profiles. """
+    prof = 'Profile' in h.ClassName()
+    return [content(h), sumw2(h), bin_entries(h) if prof else None, bin_sumw2(h) if prof else None]
+# endregion BUFFERS
+# endregion HISTOGRAM
+# ----------------------------------------
+
+
+# ----------------------------------------
+# region CONTENTS
+def cells(edges, *v):
+    """ :returns: the global ROOT bin number of every entry of the coordinates [v], bin 0 and nbins + 1 of each axis are the under- and overflow. """
+    c, n = 0, 1
+    for e, x in zip(edges, v):
+        c = c + n * np.searchsorted(e, x, side='right')
+        n *= e.size + 1
+    return c
+
+
+@Prof.timed('bin contents')
+def contents(edges, *v, w=None, profile=False, workers=1, processes=False):
+    """ :returns: the ROOT buffers [content, sumw2, bin entries, bin sumw2] of all cells of the histogram with [edges] filled with [v] and weights [w] and its statistics.
+        For profiles the last array of [v] are the profiled values. Buffers which ROOT does not need for the given input are None.
+        With more than one worker the entries are split into shards, which are binned in a thread (or process) pool and summed up. """
+    if workers > 1 and v[0].size >= 2 * ShardSize:
+        return merge(pool_map(partial(shard_contents, edges=edges, profile=profile), shards(*v, w, n=min(workers, v[0].size // ShardSize)), workers, processes))
+    st = moments(edges, *v, w=w, profile=profile)
+    v, z = (v[:-1], v[-1]) if profile else (v, None)
+    count = partial(np.bincount, cells(edges, *v), minlength=int(np.prod([e.size + 1 for e in edges])))
+    w2 = None if w is None else count(w ** 2)
+    if profile:
+        wz = z if w is None else w * z
+        return [count(wz), count(wz * z), count(w).astype('d'), w2, st]
+    return [count(w).astype('d'), w2, None, None, st]
+
+
+def moments(edges, *v, w=None, profile=False):
+    """ :returns: the sums of the weights and the weighted coordinates in the layout of TH1::GetStats, accumulated from the entries within the axis ranges as ROOT does when filling. """
+    v, z = (v[:-1], v[-1]) if profile else (v, None)
+    cut = np.all([(x >= e[0]) & (x < e[-1]) for e, x in zip(edges, v)], axis=0)
+    v, w = [x[cut] for x in v], np.ones(np.count_nonzero(cut)) if w is None else w[cut]
+    s = [w.sum(), w @ w]
+    for i, x in enumerate(v):
+        s += [w @ x, w @ x ** 2] + [w @ (v[j] * x) for j in range(i)]  # sumwx, sumwx2, sumwy, sumwy2, sumwxy, sumwz, sumwz2, sumwxz, sumwyz
+    return np.array(s + ([w @ z[cut], w @ z[cut] ** 2] if profile else []))
+
+
+def shards(*v, n):
+    i = np.linspace(0, v[0].size, n + 1).astype('i8')
+    return [[None if a is None else a[i0:i1] for a in v] for i0, i1 in zip(i[:-1], i[1:])]
+
+
+def shard_contents(v, edges, profile):
+    *v, w = v
+    return contents(edges, *v, w=w, profile=profile)
+
+
+def pool_map(f, items, workers, processes=False):
+    """ numpy releases the GIL while sorting the entries into the cells, so threads already run in parallel """
+    with (ProcessPoolExecutor if processes else ThreadPoolExecutor)(workers) as pool:
+        return list(pool.map(f, items))
+
+
+def merge(buffers):
+    """ :returns: the sum of each buffer over a list of [content, sumw2, bin entries, bin sumw2, statistics] """
+    return [None if b[0] is None else np.sum(b, axis=0) for b in zip(*buffers)]
+# endregion CONTENTS
+# ----------------------------------------
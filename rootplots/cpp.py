@@ -0,0 +1,97 @@
+# --------------------------------------------------------
+#       C++ helpers for bulk transfers between numpy and ROOT
+# created on October 17th 2026
+# --------------------------------------------------------
+from functools import partial
+from inspect import signature
+
+
+Code = '''
+#include "TMath.h"
+
+namespace rootplots {
+
+template <class H>
+void fill_n(H* h, Long64_t n, const double* x, const double* y, const double* z, const double* w) {
+    for (Long64_t i = 0; i < n; ++i) h->Fill(x[i], y[i], z[i], w[i]);
+}
+
+template <class P>
+void set_entries(P* p, const double* e) {
+    for (Int_t i = 0; i < p->GetNcells(); ++i) p->SetBinEntries(i, e[i]);
+}
+
+template <class P>
+void get_entries(P* p, double* e) {
+    for (Int_t i = 0; i < p->GetNcells(); ++i) e[i] = p->GetBinEntries(i);
+}
+
+template <class H>
+void get_values(H* h, double* v, double* e) {
+    for (Int_t i = 0; i < h->GetNcells(); ++i) {
+        v[i] = h->GetBinContent(i);
+        e[i] = h->GetBinError(i);
+    }
+}
+
+// convolution of the Landau density (width, mpv) with a Gaussian (sigma) as sum over nconv points within nsigma, normalised to area
+double langau(double x, double width, double mpv, double area, double sigma, int nconv, double nsigma) {
+    const double mpc = mpv + 0.22278298 * width;  // MP shift correction
+    const double step = 2 * nsigma * sigma / nconv;
+    double sum = 0;
+    for (int i = 1; i <= nconv / 2; ++i) {
+        const double t = nsigma * sigma - (i - .5) * step;
+        sum += TMath::Gaus(t, 0, sigma) * (TMath::Landau(x - t, mpc, width) + TMath::Landau(x + t, mpc, width));
+    }
+    return area * step * sum / width / TMath::Sqrt(TMath::TwoPi()) / sigma;
+}
+
+double erfland(double x, double c0, double mpv, double sigma, double c1, double xoff, double w, double yoff, double x0) {
+    return yoff + (x > x0 ? c0 * TMath::Landau(x, mpv, sigma) : c1 * (TMath::Erf(w * (x - xoff)) + 1));
+}
+
+double crystalball(double x, double scale, double alpha, double n, double m, double sigma, double off, bool inv) {
+    const double t = (inv ? m - x : x - m) / sigma, a = TMath::Abs(alpha);
+    if (t > -alpha) return scale * TMath::Exp(-.5 * t * t) + off;
+    return scale * TMath::Power(n / a, n) * TMath::Exp(-a * a / 2) * TMath::Power(n / a - a - t, -n) + off;
+}
+
+}
+'''
+
+Models = {}  # python model -> TFormula expression of its compiled version
+
+
+def lib():
+    """ :returns: the C++ namespace of the helpers, which are declared to the interpreter on first use. """
+    import ROOT  # deferred, so that the numpy helpers can be used without loading ROOT
+    if not hasattr(lib, 'Loaded'):
+        lib.Loaded = ROOT.gInterpreter.Declare(Code)
+    return ROOT.rootplots
+
+
+def model(formula):
+    """ decorator to register the TFormula expression [formula] (or a function of the extra arguments of the model returning it) as compiled version of a python model.
+        Only models f(x, pars, *args) can be registered, the extra arguments of other models are fixed values and not free parameters of a formula. """
+    def register(f):
+        if 'pars' not in signature(f).parameters:
+            raise TypeError(f'{f.__name__} has no argument pars, only models of the parameters pars can be compiled')
+        Models[f] = formula
+        return f
+    return register
+
+
+def formula(f, *args, **kwargs):
+    """ :returns: the TFormula expression of the compiled version of the model [f] for the extra arguments, None if there is none. """
+    if isinstance(f, partial):
+        return formula(f.func, *f.args, *args, **f.keywords, **kwargs)
+    if f not in Models:
+        return
+    lib()
+    return Models[f](*args, **kwargs) if callable(Models[f]) else Models[f]
+
+
+def langau(nconv=100, nsigma=5.):
+    """ :returns: formula of the compiled Landau-Gauss convolution with the parameters [width, mpv, area, sigma] """
+    lib()
+    return f'rootplots::langau(x, [0], [1], [2], [3], {int(nconv)}, {nsigma})'
@@ -4,22 +4,43 @@
 # created on February 15th 2018 by M. Reichmann (remichae@phys.ethz.ch)
 # --------------------------------------------------------
 
+from collections import OrderedDict
+from collections.abc import Iterator
 from functools import partial
+from hashlib import blake2b
 from inspect import signature
+from itertools import chain
+from os import environ, getpid
+from pickle import dump, load as pload
 from typing import Any
 from warnings import catch_warnings, simplefilter
 
 import numpy as np
 from ROOT import TGraphErrors, TGaxis, TLatex, TGraphAsymmErrors, TCanvas, gStyle, TLegend, TArrow, TPad, TCutG, TLine, TPaveText, TPaveStats, TH1F, TEllipse, TColor, TProfile
 from ROOT import TProfile2D, TH2F, TH3F, THStack, TMultiGraph, TPie, gROOT, TF1
-from scipy.stats import binned_statistic
-from screeninfo import get_monitors, Monitor, common
 
-from .import binning as bins
+from . import binning as bins
+from . import cpp
 from .info import Info
 from .utils import *
 
 
+CHUNK_SIZE = 10 ** 6  # number of entries handed to ROOT at once
+NStat = 13  # size of the statistics array of ROOT histograms (TH1::kNstat)
+
+__all__ = ['CHUNK_SIZE', 'NStat', 'FitRes', 'FitCache', 'Registry', 'get_color_gradient', 'Draw', 'format_histo', 'format_bar', 'format_markers', 'format_lines',
+           'format_fill', 'set_statbox', 'set_entries', 'get_window_ratio', 'get_stat_margins', 'get_stat_pos', 'format_statbox', 'format_axis', 'format_pie',
+           'format_text', 'format_frame', 'fill_hist', 'calc_buffers', 'add_buffers', 'get_stats', 'set_buffers', 'np_fill_hist', 'is_chunked', 'is_chunk_list', 'sketch',
+           'chunked', 'fill_chunks', 'set_2d_ranges', 'arr2coods', 'fix_chi2', 'make_darray', 'graph_values', 'graph_xy', 'graph_x', 'graph_y', 'graph_columns',
+           'cell_values', 'hist_values', 'hist_xy', 'hist_values_2d', 'hist_xyz', 'h_y', 'h_x', 'h_xy', 'set_bin_labels', 'make_box_args', 'make_poly_args', 'make_star',
+           'set_titles', 'shift_graph', 'get_3d_profiles', 'get_3d_correlations', 'scale_graph', 'get_quantile', 'markers', 'duo_markers', 'set_palette', 'n_pal',
+           'set_n_palette', 'is_graph', 'update_canvas', 'show_colors', 'show_wheel', 'show_line_styles', 'ax_range', 'find_z_range', 'set_drawing_range',
+           'normalise_histo', 'normalise_bins', 'set_z_range', 'set_axes_range', 'get_ax_range', 'get_dax', 'set_x_range', 'set_y_range', 'get_last_canvas',
+           'close_last_canvas', 'get_object', 'set_time_axis', 'find_mpv_fwhm', 'get_fw_center', 'find_mpv', 'get_fwhm', 'fit_fwhm', 'get_f_fwhm', 'scale_histo',
+           'find_2d_centre', 'get_2d_centre_ranges', 'centre_2d', 'make_transparent', 'hide_axis', 'remove_low_stat_bins', 'get_correlation_arrays', 'correlate_maps',
+           'correlate_all_maps', 'set_root_warnings', 'set_root_output', 'is_root_object', 'is_profile', 'np_profile']
+
+
 class FitRes(np.ndarray):
 
     def __new__(cls, f):
@@ -52,14 +73,28 @@ class FitRes(np.ndarray):
 
     def __setstate__(self, state, *args, **kwargs):
         self.Pars, self.Errors, self.Names, self.vChi2, self.vNdf = state[-5:]
+        self.Fit = None  # the ROOT object is not stored
         super(FitRes, self).__setstate__(state[0:-5])
 
     def __call__(self, x):
         return self.Fit(x) if self.is_tf1 else warning('not implemented')
 
+    @classmethod
+    def from_values(cls, pars, errors, names, chi2, ndf):
+        """ :returns: result without a ROOT object, e.g. from the cache """
+        res = np.ndarray.__new__(cls, len(pars), object)
+        res.Fit, res.NPar = None, len(pars)
+        res.Pars, res.Errors, res.Names, res.vChi2, res.vNdf = np.array(pars, 'd'), list(errors), list(names), chi2, ndf
+        res.put(np.arange(res.NPar), res.get_pars())
+        return res
+
+    @property
+    def values(self):
+        return self.Pars.tolist(), self.Errors, self.Names, self.vChi2, self.vNdf
+
     @property
     def is_tf1(self):
-        return 'TF1' in self.Fit.ClassName()
+        return self.Fit is not None and 'TF1' in self.Fit.ClassName()
 
     def get_pars(self, err=True):
         return np.array([ufloat(p, e) for p, e in zip(self.Pars, self.Errors)]) if err else self.Pars
@@ -87,6 +122,157 @@ class FitRes(np.ndarray):
         return self.vNdf
 
 
+class FitCache(object):
+    """ LRU cache of fit results keyed by a hash of the histogram (or graph) values, binning, fit function, range and options. The results are optionally also pickled to [directory].
+        Only the plain values of the results are stored, so the cache does not depend on the lifetime of the ROOT functions. """
+
+    def __init__(self, size=256, directory=None):
+        self.Size = size
+        self.Dir = None if directory is None else Path(directory).expanduser()
+        self.Data = OrderedDict()
+        self.Hits, self.Misses = 0, 0
+        self.Dir.mkdir(parents=True, exist_ok=True) if self.Dir is not None else do_nothing()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}: {len(self.Data)}/{self.Size} results, {self.Hits} hits, {self.Misses} misses' + (f', stored in {self.Dir}' if self.Dir else '')
+
+    def __contains__(self, key):
+        return key in self.Data or self.Dir is not None and self.Dir.joinpath(f'{key}.pickle').exists()
+
+    @staticmethod
+    def key(h, *args):
+        """ :returns: hash of the buffers and binning of the histogram or the points of the graph [h] and the fit parameters [args] """
+        k = blake2b(h.ClassName().encode(), digest_size=16)
+        arrays = bins.buffers(h) + bins.hedges(h) if h.InheritsFrom('TH1') else [graph_values(h, m, err=True, as_u=False) for m in ['X', 'Y']]
+        for a in arrays:
+            k.update(b'-' if a is None else np.ascontiguousarray(a).tobytes())
+        k.update(repr(args).encode())
+        return k.hexdigest()
+
+    def get(self, key):
+        """ :returns: FitRes without ROOT object or None if [key] is not cached """
+        if key in self.Data:
+            self.Data.move_to_end(key)
+        elif key in self:
+            with open(self.Dir.joinpath(f'{key}.pickle'), 'rb') as f:
+                self.store(key, pload(f))
+        else:
+            self.Misses += 1
+            return
+        self.Hits += 1
+        return FitRes.from_values(*self.Data[key])
+
+    def store(self, key, values):
+        self.Data[key] = values
+        while len(self.Data) > self.Size:
+            self.Data.popitem(last=False)
+
+    def add(self, key, res):
+        """ stores the values of the FitRes [res] and returns [res] """
+        self.store(key, res.values)
+        if self.Dir is not None:
+            with open(self.Dir.joinpath(f'{key}.pickle'), 'wb') as f:
+                dump(res.values, f)
+        return res
+
+    def fit(self, h, f='gaus', opt='qs0', xmin=0, xmax=0):
+        """ :returns: the FitRes of h.Fit(f, opt, '', xmin, xmax). For cached results the function is restored without fitting. """
+        fid = f if type(f) is str else [f.GetName(), f.GetExpFormula().Data(), [f.GetParameter(i) for i in range(f.GetNpar())]]
+        key = self.key(h, fid, opt, xmin, xmax)
+        res = self.get(key)
+        return self.add(key, FitRes(h.Fit(f, opt, '', xmin, xmax))) if res is None else FitRes(self.restore(h, f, opt, xmin, xmax, res))
+
+    @staticmethod
+    def restore(h, f, opt, xmin, xmax, res):
+        """ attaches a function with the cached result [res] to [h] and draws it like h.Fit(f, opt, '', xmin, xmax) """
+        xmin, xmax = (xmin, xmax) if xmin < xmax else (h.GetXaxis().GetXmin(), h.GetXaxis().GetXmax())
+        fun = TF1(f, f, xmin, xmax) if type(f) is str else f.Clone(f.GetName())
+        fun.SetRange(xmin, xmax)
+        fun.SetParameters(np.array(res.Pars, 'd'))
+        fun.SetParErrors(np.array(res.Errors, 'd'))
+        fun.SetChisquare(res.vChi2)
+        fun.SetNDF(res.vNdf)
+        functions = h.GetListOfFunctions()
+        for old in [] if '+' in opt else [o for o in functions if o.InheritsFrom('TF1')]:  # h.Fit replaces the previous functions unless the option contains '+'
+            functions.Remove(old)
+            old.Delete()
+        fun.SetBit(TF1.kNotDraw) if '0' in opt else do_nothing()
+        functions.Add(fun)  # owned by the histogram as after h.Fit
+        if '0' not in opt:
+            c = get_last_canvas(warn=False)
+            h.Draw() if c is None or not c.FindObject(h) else update_canvas(c)
+        return fun
+
+    def clear(self):
+        self.Data.clear()
+
+
+class Registry(object):
+    """ keeps the drawn objects alive, grouped by the canvas they belong to (the last canvas when they are added).
+        If there are more than [size] canvases (no limit if size is None), the groups of the oldest canvases which have been closed or deleted are released.
+        If the canvases are not shown (headless or batch), the oldest canvases are closed and released as well.
+        Python objects, like the callbacks of the TF1s, are referenced by ROOT without ownership and are therefore never released. """
+
+    def __init__(self, size=None):
+        self.Size = size
+        self.Groups = OrderedDict()  # canvas name -> {id: object}
+        self.Owner = {}  # object id -> canvas name
+        self.Callbacks = {}  # object id -> python object
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}: {len(self)} objects of {len(self.Groups)}/{self.Size} canvases'
+
+    def __len__(self):
+        return len(self.Owner)
+
+    def __iter__(self):
+        return chain.from_iterable(g.values() for g in self.Groups.values())
+
+    @staticmethod
+    def group(obj):
+        c = obj if hasattr(obj, 'InheritsFrom') and obj.InheritsFrom('TCanvas') else get_last_canvas(warn=False)
+        return None if c is None else c.GetName()
+
+    def add(self, *objects):
+        for obj in objects:
+            if obj is not None and not hasattr(obj, 'InheritsFrom'):
+                self.Callbacks[id(obj)] = obj
+            elif obj is not None:
+                key, old = self.group(obj), self.Owner.get(id(obj))
+                self.Groups[old].pop(id(obj)) if old is not None and old in self.Groups else do_nothing()
+                self.Groups.setdefault(key, {})[id(obj)] = obj
+                self.Groups.move_to_end(key)
+                self.Owner[id(obj)] = key
+        if self.Size is not None and len(self.Groups) > self.Size:
+            self.evict()
+
+    @staticmethod
+    def hidden():
+        return Draw.Headless or not Draw.Show or gROOT.IsBatch()
+
+    def evict(self):
+        """ releases the oldest groups of the canvases which are not open anymore or not shown, except the current one and the free canvases of the export mode """
+        canvases, hidden = {c.GetName(): c for c in gROOT.GetListOfCanvases()}, self.hidden()
+        pooled = {c.GetName() for free in Draw.Canvases.values() for c in free}
+        old = [k for k in list(self.Groups)[:-1] if k is not None and k not in pooled and (hidden or k not in canvases)]
+        for key in old[:len(self.Groups) - self.Size]:
+            canvases[key].Close() if key in canvases else do_nothing()
+            self.drop(key)
+
+    def drop(self, key):
+        for i in self.Groups.pop(key, {}):
+            self.Owner.pop(i, None)
+
+    def release(self, c=None):
+        """ releases the canvas [c] (the last one if None) and all objects belonging to it """
+        c = choose(c, get_last_canvas, warn=False)
+        self.drop(c if c is None or type(c) is str else c.GetName())
+
+    def clear(self):
+        self.Groups.clear()
+        self.Owner.clear()
+
+
 def get_color_gradient():
     stops = np.array([0., .5, 1], 'd')
     green = np.array([0. / 255., 200. / 255., 80. / 255.], 'd')
@@ -103,10 +289,16 @@ class Draw(object):
     Config = None
     Monitor = None
     Res = None
+    Headless = False  # no display: no monitor probing, fixed canvas sizes and always batch mode
 
     Count = {}
-    Colors = get_color_gradient()
-    Objects = []
+    Prefix = ''  # prefix of the object names, unique for each worker process
+    Colors = None  # colour gradient, created on first use
+    Objects = Registry()
+
+    Export = False  # batch export mode: ROOT stays in batch mode and the canvases are reused after saving
+    FileTypes = ['pdf']
+    Canvases = {}  # free canvases of the export mode by size
 
     Show = True
     Title = True
@@ -115,6 +307,8 @@ class Draw(object):
     Font = 42
     Solid = 1001
     Palette = 1
+    Workers = 1
+    Fits = FitCache()
 
     DefaultStats = {'x2': None, 'y2': None, 'h': None, 'w': .3, 'entries': False, 'm': False, 'rms': False, 'all_stat': True, 'fit': False, 'center_x': False, 'center_y': False, 'form': None}
     Stats = {}
@@ -130,12 +324,18 @@ class Draw(object):
             Draw.Title = Draw.Config.get_value('SAVE', 'activate title', default=True)
             Draw.FillColor = Draw.Config.get_value('PLOTS', 'fill color', default=821)
             Draw.Font = Draw.Config.get_value('PLOTS', 'legend font', default=42)
-            Draw.Show = Draw.Config.get_value('SAVE', 'show', default=True)
-            Draw.Monitor = Draw.find_monitor()
+            Draw.Headless = Draw.Headless or environ.get('ROOTPLOTS_HEADLESS', '').lower() in ['1', 'true', 'yes'] or Draw.Config.get_value('DRAW', 'headless', default=False)
+            Draw.Show = Draw.Config.get_value('SAVE', 'show', default=True) and not Draw.Headless
+            Draw.Monitor = Draw.find_monitor() if not Draw.Headless else None
             Draw.Res = Draw.load_resolution()
             Draw.Palette = Draw.Config.get_value('PLOTS', 'palette', default=1)
+            Draw.Workers = Draw.Config.get_value('DRAW', 'workers', default=1)
+            Prof.Active = Draw.Config.get_value('DRAW', 'profile', default=False)
+            Draw.Objects.Size = Draw.Config.get_value('DRAW', 'canvases', default=100) or None
+            Draw.Fits = FitCache(Draw.Config.get_value('DRAW', 'fit cache size', default=256), Draw.Config.get_value('DRAW', 'fit cache directory', default=None))
 
             Draw.setup()
+            gROOT.SetBatch(True) if Draw.Headless else do_nothing()
             Draw.Info = Info(self)
 
         self.Info = self.init_info()
@@ -173,6 +373,7 @@ class Draw(object):
     # region INIT
     @staticmethod
     def find_monitor():
+        from screeninfo import get_monitors, Monitor, common  # slow import, only needed once
         if Draw.Config.get_value('MONITOR', 'load', default=True):
             try:
                 monitors = sorted(get_monitors(), key=lambda mon: mon.x)
@@ -186,26 +387,31 @@ class Draw(object):
     def load_resolution():
         """ returns: default plot height in pixels."""
         h = Draw.Config.get_value('DRAW', 'plot height ndc', float, default=.7)
-        return int(Draw.Monitor.height * h)
+        return int((Draw.Config.get_list('MONITOR', 'default', default=[1920, 1080])[1] if Draw.Monitor is None else Draw.Monitor.height) * h)
 
     def init_info(self):
         return Info(Draw)
+
+    @staticmethod
+    def init_worker(config=None, prefix=None, pal=None, profile=None):
+        """ sets up an independent drawing state in a worker process, which does not share names or objects with the other processes """
+        Draw.Config, Draw.Headless, Draw.Prefix = None, True, choose(prefix, f'p{getpid()}_')
+        Draw.Count, Draw.Stats, Draw.Canvases, Draw.Objects = {}, {}, {}, Registry()
+        Draw(config)
+        set_palette(pal) if pal is not None else do_nothing()
+        Prof.Active = choose(profile, Prof.Active)
     # endregion INIT
     # ----------------------------------------
 
     @staticmethod
     def add(*args):
-        for obj in args:
-            Draw.Objects.append(obj)
-        Draw.clean()
+        Draw.Objects.add(*args)
         return args[0] if len(args) == 1 else args
 
     @staticmethod
-    def clean():
-        for obj in Draw.Objects:
-            # if '0x(nil)' in str(obj) or obj is None:
-            if obj is None:
-                Draw.Objects.remove(obj)
+    def release(c=None):
+        """ releases the canvas [c] (the last one if None) and all drawn objects belonging to it """
+        Draw.Objects.release(c)
 
     # ----------------------------------------
     # region SET
@@ -229,7 +435,37 @@ class Draw(object):
 
     @staticmethod
     def set_show(status=ON):
-        set_root_output(status and Draw.Show)
+        set_root_output(status and Draw.Show) if not Draw.Export else do_nothing()
+
+    @staticmethod
+    def set_export(status=True, ftypes=None):
+        """ switches the batch export mode on or off. The plots are saved in all [ftypes] (default from the config) """
+        Draw.Export = status
+        Draw.FileTypes = choose(make_list(ftypes) if ftypes is not None else None, Draw.Config.get_list('DRAW', 'file types', default=['pdf']) if status else ['pdf'])
+        Draw.Canvases = {}
+        set_root_output(not status and Draw.Show)
+
+    @staticmethod
+    def release_canvas(c):
+        """ returns the canvas [c] to the pool of the export mode after it was saved """
+        if Draw.Export:
+            free = Draw.Canvases.setdefault((c.GetWw(), c.GetWh()), [])
+            free.append(c) if c not in free else do_nothing()
+
+    @staticmethod
+    def reuse_canvas(title, w, h):
+        """ :returns: a cleared canvas of the size [w, h] from the pool of the export mode, None if there is none """
+        free = Draw.Canvases.get((w, h))
+        if free:
+            c = free.pop()
+            Draw.release(c)  # objects of the previous plot
+            c.Clear()
+            c.UseCurrentStyle()
+            c.SetTitle(title)
+            canvases = gROOT.GetListOfCanvases()  # make it the last canvas again
+            canvases.Remove(c)
+            canvases.Add(c)
+            return c
     # endregion SET
     # ----------------------------------------
 
@@ -247,6 +483,7 @@ class Draw(object):
 
     @staticmethod
     def get_colors(n):
+        Draw.Colors = get_color_gradient() if Draw.Colors is None else Draw.Colors
         return Draw.Colors[np.linspace(0, Draw.Colors.size - 1, n).round().astype(int)].tolist()
 
     @staticmethod
@@ -262,7 +499,7 @@ class Draw(object):
     
     @staticmethod
     def get_name(string='a'):
-        return '{}{}'.format(string, Draw.get_count(string))
+        return '{}{}{}'.format(Draw.Prefix, string, Draw.get_count(string))
 
     @staticmethod
     def get_margins(c):
@@ -273,12 +510,15 @@ class Draw(object):
     # ----------------------------------------
     # region DRAWING
     @staticmethod
+    @Prof.timed('canvas')
     def canvas(title='c', x=None, y=None, w=1., h=1., logx=None, logy=None, logz=None, gridx=None, gridy=None, transp=None, divide=None, show=True):
         Draw.set_show(show)
-        c0 = get_last_canvas(warn=False)
-        x = x if x is not None else 0 if c0 is None else c0.GetWindowTopX() + 50
-        y = y if y is not None else 0 if c0 is None else c0.GetWindowTopY() + 20
-        c = TCanvas(Draw.get_name('c'), title, int(x), int(y), int(w * Draw.Res), int(h * Draw.Res))
+        c = Draw.reuse_canvas(title, int(w * Draw.Res), int(h * Draw.Res)) if Draw.Export else None
+        if c is None:
+            c0 = None if Draw.Headless else get_last_canvas(warn=False)
+            x = x if x is not None else 0 if c0 is None else c0.GetWindowTopX() + 50
+            y = y if y is not None else 0 if c0 is None else c0.GetWindowTopY() + 20
+            c = TCanvas(Draw.get_name('c'), title, int(x), int(y), int(w * Draw.Res), int(h * Draw.Res))
         do([c.SetLogx, c.SetLogy, c.SetLogz], [logx, logy, logz])
         do([c.SetGridx, c.SetGridy], [gridx, gridy])
         do(make_transparent, c, transp)
@@ -517,6 +757,7 @@ class Draw(object):
         return leg
 
     @staticmethod
+    @Prof.timed('draw')
     def histo(th, show=True, lm=None, rm=None, bm=None, tm=None, m=None, draw_opt=None, wx=1, hy=1, logx=None, logy=None, logz=None, grid=None, gridy=None, gridx=None, phi=None, theta=None,
               leg=None, ldraw=None, canvas=None, sumw2=None, stats=False, all_pads=False, info_leg=True, **kwargs):
         wx += .16 if not Draw.Title and wx == 1 else 0  # rectify if there is no title
@@ -559,8 +800,9 @@ class Draw(object):
         if is_root_object(x):
             th = x
         else:
+            (x,), chunks = chunked(x, binning=binning)
             th = TH1F(Draw.get_name('h'), title, *choose(binning, bins.find, values=x, q=q, nbins=n, lfac=lf, rfac=rf, r=r, w=w, x0=x0, x1=x1))
-            fill_hist(th, x)
+            fill_chunks(th, chunks)
         format_histo(th, **prep_kw(kwargs, **Draw.mode(), fill_color=Draw.FillColor, y_tit='Number of Entries' if not th.GetYaxis().GetTitle() else None))
         self.histo(th, **prep_kw(kwargs, stats=None))
         return th
@@ -596,9 +838,9 @@ class Draw(object):
         if y is None:
             p = x
         else:
-            x, y = np.array(x, dtype='d'), np.array(y, dtype='d')
+            (x, y), chunks = chunked(x, y, binning=binning)
             p = TProfile(Draw.get_name('p'), title, *choose(binning, bins.find, lfac=lf, rfac=rf, values=x, q=q, w=w, x0=x0))
-            fill_hist(p, x, y)
+            fill_chunks(p, chunks)
         p = self.make_graph_from_profile(p) if graph else p
         format_histo(p, **prep_kw(dkw, **Draw.mode(), fill_color=Draw.FillColor))
         self.histo(p, **prep_kw(dkw, stats=choose(get_kw('stats', dkw), set_statbox, entries=True, w=.25)))
@@ -611,9 +853,7 @@ class Draw(object):
         else:
             x, y = np.array(x, dtype='d'), np.array(y, dtype='d')
             binning = choose(binning, bins.find, lfac=lf, rfac=rf, values=x, q=q, w=w, x0=x0)
-            e = np.histogram(x, binning[1])[0]  # number of entries in each bin
-            x = [np.sum(v) for v in np.split(y, np.unique(np.cumsum(e)))]
-            h = fill_hist(TH1F(Draw.get_name('sh'), title, *binning), x, set_bins=True)
+            h = np_fill_hist(TH1F(Draw.get_name('sh'), title, *binning), x, w=y)  # the sum of the weights is the sum of the values in each bin
         format_histo(h, **prep_kw(dkw, **Draw.mode(), fill_color=Draw.FillColor, stats=False, y_range=[0, 1.1 * h.GetMaximum()]))
         self.histo(h, **prep_kw(dkw, stats=choose(get_kw('stats', dkw), set_statbox, entries=True, w=.25)))
         return h
@@ -622,10 +862,10 @@ class Draw(object):
         if is_root_object(x):
             p = x
         else:
-            x, y, zz = arr2coods(x) if y is None else (x, y, zz)
+            (x, y, zz), chunks = chunked(*arr2coods(x) if y is None else (x, y, zz), binning=binning)
             dflt_bins = bins.find(x) + bins.find(y) if binning is None else None
             p = TProfile2D(Draw.get_name('p2'), title, *choose(binning, dflt_bins))
-            fill_hist(p, x, y, uarr2n(zz))
+            fill_chunks(p, chunks)
         p = self.rotate_2d(p, rot)
         p = self.flip_2d(p, mirror)
         (rx, ry), rz = get_2d_centre_ranges(p, centre), find_z_range(p, qz, z0)
@@ -639,10 +879,10 @@ class Draw(object):
         if y is None:
             th = x
         else:
-            x, y = np.array(x, dtype='d'), np.array(y, dtype='d')
+            (x, y), chunks = chunked(x, y, binning=binning)
             b = partial(bins.find, q=q, nbins=n, rfac=rf, lfac=lf, w=w)
             th = TH2F(Draw.get_name('h2'), title, *(b(x, x0=x0, x1=x1) + b(y, x0=y0, x1=y1)) if binning is None else binning)
-            fill_hist(th, x, y)
+            fill_chunks(th, chunks)
         th = self.rotate_2d(th, rot)
         th = self.flip_2d(th, mirror)
         (rx, ry), rz = get_2d_centre_ranges(th, centre), find_z_range(th, qz, z0)
@@ -652,15 +892,16 @@ class Draw(object):
         return th
 
     def histo_3d(self, x, y, zz, binning=None, title='', q=.02, **dkw):
+        (x, y, zz), chunks = chunked(x, y, zz, binning=binning)
         th = TH3F(Draw.get_name('h3'), title, *bins.find(x, q=q) + bins.find(y, q=q) + bins.find(zz, q=q) if binning is None else binning)
-        fill_hist(th, x, y, zz)
+        fill_chunks(th, chunks)
         format_histo(th, **prep_kw(dkw))
         self.histo(th, **prep_kw(dkw, draw_opt='colz', show=False))
         return th
 
     def efficiency(self, x, e, binning=None, q=.02, w=None, x0=None, **kwargs):
         p = self.profile(x, e, binning, q=q, w=w, x0=x0, show=False)
-        x, y = bins.hx(p), np.array([calc_eff(p0 * n, n) if n else [-1, 0, 0] for p0, n in [[p.GetBinContent(ibin), p.GetBinEntries(ibin)] for ibin in range(1, p.GetNbinsX() + 1)]])
+        x, y = bins.hx(p), np.array([calc_eff(p0 * n, n) if n else [-1, 0, 0] for p0, n in zip(hist_values(p, err=False), bins.entries(p))])
         return self.graph(x[y[:, 0] != -1], y[y[:, 0] != -1], **prep_kw(kwargs, title='Efficiency', y_tit='Efficiency [%]'))
 
     def pull(self, h, binning=None, ret_h=False, **dkw):
@@ -717,9 +958,9 @@ class Draw(object):
 
     def prof2hist(self, p):
         b = bins.h2d(p)
-        h, nx, ny = self.histo_2d([], [], b, show=False), b[0], b[2]
-        xax, yax = p.GetXaxis(), p.GetYaxis()
-        [h.Fill(xax.GetBinCenter(ix), yax.GetBinCenter(iy)) for ix in range(1, nx + 2) for iy in range(1, ny + 2) for _ in range(bins.single_entries_2d(p, ix, iy, nx))]
+        h = self.histo_2d([], [], b, show=False)
+        bins.set_2d_values(h, bins.entries_2d(p))
+        h.SetEntries(int(p.GetEntries()))
         return h
 
     @staticmethod
@@ -746,21 +987,23 @@ class Draw(object):
 
     # ----------------------------------------
     # region OPERATIONS
-    def operate(self, h, f, *args, **kwargs):
-        h0, h = h, self.prof2d([], [], [], bins.h2d(h), show=False)
-        prof = 'Profile' in h0.ClassName()
-        x, n = hist_values_2d(h0, err=False, flat=False), bins.entries_2d(h0) if prof else 1
-        bins.set_2d_values(h, f(x * n, *args, **kwargs))
-        bins.set_2d_entries(h, f(n, *args, **kwargs)) if prof else do_nothing()
-        h.SetEntries(int(h0.GetEntries()))
-        format_histo(h, z_range=[h0.GetMinimum(), h0.GetMaximum()], **{f'{i}_tit': getattr(h0, f'Get{i.title()}axis')().GetTitle() for i in ['x', 'y', 'z']}, ncont=h0.GetContour())
-        return h
-
-    def rotate_2d(self, h, n=2):
-        return self.operate(h, np.rot90, n) if n is not None else h
-
-    def flip_2d(self, h, axis=0):
-        return self.operate(h, np.flip, axis=axis) if axis is not None else h
+    @staticmethod
+    def operate(h, f, *args, inplace=False, **kwargs):
+        """ applies the array operation [f] to the content, sumw2 and entries buffers of the 2D histogram [h] in place or on a clone. Under- and overflow are cleared. """
+        shape, n = (h.GetNbinsY() + 2, h.GetNbinsX() + 2), h.GetEntries()
+        b = [None if a is None else np.pad(f(a.reshape(shape)[1:-1, 1:-1], *args, **kwargs), 1) for a in bins.buffers(h)]  # new arrays, so h may be overwritten
+        h = h if inplace else Draw.add(h.Clone(Draw.get_name('h')))
+        if f is np.transpose or f is np.rot90 and (args[0] if args else kwargs.get('k', 1)) % 2:  # the axes are swapped, also if they have the same number of bins
+            (x, y), tit = bins.hedges(h), [h.GetXaxis().GetTitle(), h.GetYaxis().GetTitle()]
+            h.SetBins(y.size - 1, y, x.size - 1, x)
+            format_histo(h, x_tit=tit[1], y_tit=tit[0])
+        return set_buffers(h, *[None if a is None else a.flatten() for a in b], n=n)
+
+    def rotate_2d(self, h, n=2, inplace=False):
+        return self.operate(h, np.rot90, n, inplace=inplace) if n is not None else h
+
+    def flip_2d(self, h, axis=0, inplace=False):
+        return self.operate(h, np.flip, axis=axis, inplace=inplace) if axis is not None else h
     # endregion OPERATIONS
     # ----------------------------------------
 
@@ -784,11 +1027,14 @@ class Draw(object):
 
     @staticmethod
     def make_tf1(name, f, xmin=0, xmax=1, pars0: Any = 0, color=None, w=None, style=None, title=None, npx=None, *args, **kwargs):
+        """ creates a TF1 from the compiled version of the model [f] if it is registered in cpp.Models, else from a python callback. """
         def tmp(x, pars):
             return f(x[0], pars, *args, **kwargs) if 'pars' in signature(f).parameters else f(x[0], *args, **kwargs)
 
-        Draw.add(tmp)
-        f0 = TF1(choose(name, Draw.get_name('f')), tmp, xmin, xmax, len(pars0) if is_iter(pars0) else pars0)
+        fm = cpp.formula(f, *args, **kwargs)
+        if fm is None:
+            Draw.add(tmp)
+        f0 = TF1(choose(name, Draw.get_name('f')), tmp, xmin, xmax, len(pars0) if is_iter(pars0) else pars0) if fm is None else TF1(choose(name, Draw.get_name('f')), fm, xmin, xmax)
         [f0.SetParameter(i, p) for i, p in enumerate(pars0)] if is_iter(pars0) else do_nothing()
         do(f0.SetNpx, npx)
         format_histo(f0, choose(title, name), line_color=color, line_style=style, lw=w)
@@ -796,17 +1042,12 @@ class Draw(object):
 
     @staticmethod
     def make_tgraph(x=None, y=None, **kwargs):
-        if len(list(x)) != len(list(y)) or not len(x):
+        (x, ax), (y, ay) = graph_columns(x), graph_columns(y)
+        if x.shape[0] != y.shape[0] or not x.shape[0]:
             return warning('Arrays have different size!')
-        d = [[make_list(i) for i in lst] for lst in [x, y]]  # make all entries np.arrays
-        if any([i.size == 3 for lst in d for i in lst]):
-            x, y = np.array(array([[[v[0].n, v[0].s, v[0].s] if is_ufloat(v[0]) else append(v, zeros(3 - v.size)) for v in lst] for lst in d]).tolist())  # noqa
-            x, ex1, ex2, y, ey1, ey2 = [a.astype('d') for a in np.concatenate([x.T, y.T])]
-            g = TGraphAsymmErrors(len(x), x, y, ex1, ex2, ey1, ey2)
-        else:
-            x, y = np.array([[[v[0].n, v[0].s] if is_ufloat(v[0]) else np.append(v, zeros(2 - v.size)) for v in lst] for lst in d])
-            x, ex, y, ey = [a.astype('d') for a in np.concatenate([x.T, y.T])]
-            g = TGraphErrors(len(x), x, y, ex, ey)
+        asym = ax or ay
+        (x, *ex), (y, *ey) = [np.ascontiguousarray(a[:, :3 if asym else 2].T) for a in [x, y]]
+        g = TGraphAsymmErrors(x.size, x, y, *ex, *ey) if asym else TGraphErrors(x.size, x, y, *ex, *ey)
         format_histo(g, Draw.get_name('g'), **prep_kw(kwargs, marker=20, markersize=1.2))
         return Draw.add(g)
 
@@ -850,6 +1091,7 @@ class Draw(object):
 
 # ----------------------------------------
 # region FORMATTING TODO: make separate class
+@Prof.timed('format')
 def format_histo(histo, name=None, title=None, x_tit=None, y_tit=None, z_tit=None, marker=None, color=None, line_color=None, line_style=None, markersize=None, x_off=None, y_off=None, z_off=None,
                  lw=None, fill_color=None, fill_style=None, stats=None, tit_size=None, lab_size=None, xls=None, yls=None, l_off_y=None, l_off_x=None, draw_first=False,
                  x_range=None, xr=None, y_range=None, yr=None, z_range=None, zr=None,
@@ -958,6 +1200,7 @@ def get_stat_pos(c, nentries, x2=None, y2=None, d=.01, h=None, w=.3, center_x=Fa
     return x1, y1, x2, y2
 
 
+@Prof.timed('statbox')
 def format_statbox(th, x2=None, y2=None, d=.01, h=None, w=.3, entries=False, m=False, rms=False, all_stat=False, fit=False, fit_opt=None, stat_opt=None, center_x=False,
                    center_y=False, bottom=False, left=False, form=None, c=None):
     c = choose(c, get_last_canvas(warn=False))
@@ -1027,37 +1270,141 @@ def format_frame(frame):
 # ----------------------------------------
 
 
-def fill_hist(h, x, y=None, zz=None, set_bins=False):
+@Prof.timed('fill')
+def fill_hist(h, x, y=None, zz=None, w=None, set_bins=False, n=CHUNK_SIZE, workers=None):
+    """ fills the histogram [h] with the arrays in chunks of [n] entries, each chunk is handed to ROOT in a single call.
+        With more than one worker the bin buffers are calculated in parallel shards and added to [h]. """
     if set_bins:
-        for i, v in enumerate(x, 1):
-            h.SetBinContent(i, np.array(v, dtype='d'))
+        c = np.zeros(h.GetNcells())
+        c[1:len(x) + 1] = np.array(x, dtype='d')
+        h.SetContent(c)
         return h
     if len(x) and is_ufloat(x[0]):
-        for i, v in enumerate(x, 1):
-            h.SetBinContent(i, v.n)
-            h.SetBinError(i, v.s)
-        return
-    x, y, zz = np.array(x).astype('d'), np.array(y).astype('d'), np.array(zz).astype('d')
-    if len(x.shape) > 1:
-        y = np.array(x[:, 1])
-        x = np.array(x[:, 0])
+        c, e = np.zeros((2, h.GetNcells()))
+        c[1:len(x) + 1], e[1:len(x) + 1] = uarr2n(x), uarr2s(x)
+        h.SetContent(c)
+        h.SetError(e)
+        return h
+    x = np.asarray(x)
+    if x.ndim > 1:
+        x, y = x[:, 0], x[:, 1]
     if not x.size:  # return if there are no entries
-        return
-    if h.ClassName() == 'TProfile2D':
-        for i in range(x.size):
-            h.Fill(x[i], y[i], zz[i])
-    elif 'TH1' in h.ClassName():
-        h.FillN(x.size, x, np.ones(x.size))
-    elif any(name in h.ClassName() for name in ['TH2', 'TProfile']):
-        h.FillN(x.size, x, y, np.ones(x.size))
-    elif h.ClassName() == 'TProfile2D':
-        h.FillN(x.size, x, y, zz, np.ones(x.size))
-    else:
-        for i in range(x.size):
-            h.Fill(x[i], y[i], zz[i])
+        return h
+    if choose(workers, Draw.Workers) > 1:
+        return np_fill_hist(h, x, y, zz, w, workers)
+    dim = h.GetDimension() + is_profile(h)  # number of coordinates per entry
+    if dim > 3:
+        raise ValueError(f'cannot fill {h.ClassName()} with {dim} coordinates')
+    for i in range(0, x.size, n):
+        v = [np.ascontiguousarray(a[i:i + n], dtype='d') for a in [x, y, zz][:dim]]
+        wi = np.ones(v[0].size) if w is None else np.ascontiguousarray(w[i:i + n], dtype='d')
+        if dim == 3:
+            cpp.lib().fill_n(h, v[0].size, *v, wi)
+        else:
+            h.FillN(v[0].size, *v, wi)
+    return h
+
+
+def calc_buffers(h, x, y=None, zz=None, w=None, workers=None):
+    v = [i for i in [x, y, zz] if i is not None]
+    return bins.contents(bins.hedges(h), *v, w=w, profile='Profile' in h.ClassName(), workers=choose(workers, Draw.Workers))
+
+
+def add_buffers(h, b, n=0):
+    """ adds the buffers [b] to the ones of [h]. Missing sumw2 buffers are equal to the content (bin entries) for unweighted fills. """
+    c = bins.buffers(h)
+    s, bs = [None if c[i] is None and b[i] is None else choose(c[i], c[i - 1]) + choose(b[i], b[i - 1]) for i in [1, 3]]
+    e = None if b[2] is None else c[2] + b[2]
+    return set_buffers(h, c[0] + b[0], s, e, bs, get_stats(h)[:b[4].size] + b[4], n=h.GetEntries() + n)
+
+
+def get_stats(h):
+    s = np.zeros(NStat)
+    h.GetStats(s)
+    return s
+
+
+def set_buffers(h, content, sumw2=None, bin_entries=None, bin_sumw2=None, stats=None, n=None):
+    """ writes the arrays of all cells (including under- and overflow) into the buffers of [h] with a single transfer each.
+        The [stats] in the layout of TH1::GetStats are accumulated from the filled values, without them they are recalculated from the bin centres. """
+    h.SetContent(np.ascontiguousarray(content, dtype='d'))
+    if sumw2 is not None:
+        h.Sumw2() if not h.GetSumw2N() else do_nothing()
+        h.GetSumw2().Set(h.GetNcells(), np.ascontiguousarray(sumw2, dtype='d'))
+    if bin_entries is not None:
+        cpp.lib().set_entries(h, np.ascontiguousarray(bin_entries, dtype='d'))
+    if bin_sumw2 is not None:
+        h.Sumw2() if not h.GetBinSumw2().GetSize() else do_nothing()
+        h.GetBinSumw2().Set(h.GetNcells(), np.ascontiguousarray(bin_sumw2, dtype='d'))
+    h.ResetStats() if stats is None else h.PutStats(np.pad(np.asarray(stats, 'd'), (0, NStat - len(stats))))
+    do(h.SetEntries, n)
     return h
 
 
+def np_fill_hist(h, x, y=None, zz=None, w=None, workers=None):
+    """ fills the histogram [h] by calculating all bin buffers with numpy and adding them to the ones of ROOT at once. """
+    x, y, zz, w = [None if v is None else np.asarray(v, dtype='d') for v in [x, y, zz, w]]
+    if x.ndim > 1:
+        x, y = x[:, 0], x[:, 1]
+    return add_buffers(h, calc_buffers(h, x, y, zz, w, workers), n=x.size)
+
+
+def is_chunked(x):
+    """ :returns: whether [x] is a memory-mapped array, an iterator or a list of chunks, which should not be loaded into memory at once. """
+    return isinstance(x, (np.memmap, Iterator)) or is_chunk_list(x)
+
+
+def is_chunk_list(x):
+    """ :returns: whether [x] is a list of arrays, each of which is a chunk of the values. Lists mixing arrays with other values are ambiguous. """
+    if not isinstance(x, (list, tuple)) or not any([isinstance(i, np.ndarray) for i in x]):
+        return False
+    if not all([isinstance(i, np.ndarray) and i.ndim > 0 for i in x]):
+        raise ValueError('ambiguous input: the list mixes arrays with other values, use a single array or a list of arrays (chunks)')
+    return True
+
+
+def sketch(chunks):
+    """ :returns: QuantileSketch of all values of the list of [chunks] to find the binning in a first pass. """
+    if any([c.ndim > 1 for c in chunks]):
+        raise ValueError('chunks with several columns require an explicit binning')
+    s = bins.QuantileSketch()
+    for c in chunks:
+        s.update(uarr2n(c))
+    return s
+
+
+def chunked(*v, binning=None, n=CHUNK_SIZE):
+    """ :returns: the values to find the binning and an iterable of aligned chunks of the coordinates [v]. Memory-mapped arrays are sliced into chunks of [n] entries.
+        Lists of chunks are read twice, first into a QuantileSketch to find the binning (if not given) and then to fill.
+        Iterators of chunks can only be read once, so their [binning] has to be given explicitly. """
+    kind = ['iter' if isinstance(i, Iterator) else 'list' if is_chunk_list(i) else 'memmap' if isinstance(i, np.memmap) else None for i in v]
+    if not any(kind):
+        return v, [v]
+    if any([k in kind and kind.count(k) != len(v) for k in ['iter', 'list']]):
+        raise ValueError('iterators and lists of chunks cannot be combined with other inputs')
+    if kind[0] == 'iter':
+        if binning is None:
+            raise ValueError('iterators of chunks require an explicit binning, since they can only be read once. Use a list of chunks to find the binning.')
+        return [None] * len(v), zip(*v)
+    if kind[0] == 'list':
+        if len({tuple(len(c) for c in i) for i in v}) > 1:
+            raise ValueError('the lists of chunks of the coordinates are not aligned')
+        return [None] * len(v) if binning is not None else [sketch(i) for i in v], zip(*v)
+    return v, ([i[j:j + n] for i in v] for j in range(0, len(v[0]), n))
+
+
+@Prof.timed('fill')
+def fill_chunks(h, chunks):
+    """ fills the empty histogram [h] with the sum of the buffers of each chunk, so that only a single chunk is in memory at once. """
+    b, n = None, 0
+    for c in chunks:
+        c = [np.asarray(uarr2n(i), dtype='d') for i in c]
+        c = [c[0][:, 0], c[0][:, 1]] if c[0].ndim > 1 else c
+        ci = calc_buffers(h, *c)
+        b, n = ci if b is None else [None if i is None else i + j for i, j in zip(b, ci)], n + c[0].size
+    return h if b is None else set_buffers(h, *b, n=n)
+
+
 def set_2d_ranges(h, dx, dy):
     # find centers in x and y
     xmid, ymid = [(p.GetBinCenter(p.FindFirstBinAbove(0)) + p.GetBinCenter(p.FindLastBinAbove(0))) / 2 for p in [h.ProjectionX(), h.ProjectionY()]]
@@ -1086,21 +1433,22 @@ def fix_chi2(g, prec=.01, show=True):
 
 
 def make_darray(values):
-    return np.array([v.n for v in values] if is_ufloat(values[0]) else values, dtype='d')
+    return np.array(uarr2n(values), dtype='d')
 
 
 # ----------------------------------------
 # region GRAPH VALUES
 def graph_values(g, m, err=False, as_u=True):
     if is_iter(g):
-        return np.array([v for ig in g for v in graph_values(ig, m, err)])
-    v = np.frombuffer(getattr(g, f'Get{m}')())
+        values = [graph_values(ig, m, err, as_u) for ig in g]
+        return uconcatenate(values) if as_u else np.concatenate(values)
+    v = np.frombuffer(getattr(g, f'Get{m}')(), count=g.GetN()).copy()
     if 'Asym' in g.ClassName() and err:
         e = np.array([np.frombuffer(getattr(g, f'GetE{m}{att}')(), count=g.GetN()) for att in ['low', 'high']]).T
-        return make_ufloat(v, mean(e, axis=1)) if as_u else np.column_stack([v, e])
+        return UArray(v, s0=e[:, 0], s1=e[:, 1]) if as_u else np.column_stack([v, e])
     elif 'Error' in g.ClassName() and err:
-        e = np.frombuffer(getattr(g, f'GetE{m}')())
-        return make_ufloat(v, e) if as_u else np.array([v, e]).T
+        e = np.frombuffer(getattr(g, f'GetE{m}')(), count=g.GetN())
+        return UArray(v, e) if as_u else np.array([v, e]).T
     return v
 
 
@@ -1114,27 +1462,62 @@ def graph_x(g, err=True, as_u=True):
 
 def graph_y(g, err=True, as_u=True):
     return graph_values(g, 'Y', err, as_u)
+
+
+def graph_columns(v):
+    """ :returns: float64 array with the columns [value, lower error, upper error] of the graph coordinates [v] and whether they have asymmetric errors.
+        [v] may be a UArray, a tuple of value and error arrays, a plain or Nx2/Nx3 array, or a sequence of ufloats, AsymVars and (value, error(s)) entries.
+        The errors of ufloats are used for both sides, missing errors of plain entries are 0. """
+    if isinstance(v, UArray):
+        return np.column_stack([v.N, v.S0, v.S1]).reshape(-1, 3), v.Asym
+    if type(v) is tuple and 1 < len(v) < 4 and all([isinstance(i, np.ndarray) and i.ndim == 1 for i in v]):
+        v = np.array(v, 'd').T
+    if not len(v):
+        return np.zeros((0, 3)), False
+    a = np.asarray(v) if isinstance(v, np.ndarray) or not any([is_iter(i) or is_ufloat(i) for i in v]) else None
+    if a is not None and a.dtype != object and (a.ndim == 1 or a.ndim == 2 and a.shape[1] < 4):
+        a = a.astype('d').reshape(a.shape[0], -1)
+        return np.column_stack([a, np.zeros((a.shape[0], 3 - a.shape[1]))]), a.shape[1] == 3
+    if all([type(i) in [Variable, AffineScalarFunc] for i in v]):
+        u = UArray.from_ufloat(v)
+        return np.column_stack([u.N, u.S0, u.S1]), False
+    d = [i if is_ufloat(i) else make_list(i) for i in v]
+    d = [i[0] if not is_ufloat(i) and is_ufloat(i[0]) else i for i in d]
+    rows = [[i.n, i.s0, i.s1] if type(i) is AsymVar else [i.n, i.s, i.s] if is_ufloat(i) else [*i, *[0] * (3 - len(i))] for i in d]
+    return np.array(rows, 'd'), any([type(i) is AsymVar or not is_ufloat(i) and len(i) == 3 for i in d])
+
+
 # endregion GRAPH VALUES
 # ----------------------------------------
 
 
 # ----------------------------------------
 # region HISTOGRAM VALUES
-def hist_values(h, err=True):
-    return np.array([ufloat(h.GetBinContent(i), h.GetBinError(i)) if err else h.GetBinContent(i) for i in bins.hn(h)])
+def cell_values(h):
+    """ :returns: values and errors of all cells (including under- and overflow) of [h] """
+    if 'Profile' in h.ClassName() or h.GetBinErrorOption():
+        v, e = np.zeros((2, h.GetNcells()))
+        cpp.lib().get_values(h, v, e)
+        return v, e
+    c, s = bins.content(h).astype('d'), bins.sumw2(h)
+    return c, np.sqrt(np.abs(c) if s is None else s)
+
+
+def hist_values(h, err=True, as_u=True):
+    v, e = [a[1:-1] for a in cell_values(h)]
+    return (arr2u(v, e) if as_u else np.array([v, e]).T) if err else v
 
 
 def hist_xy(h, err=True, raw=False):
     if type(h) in [np.ndarray, list]:
-        return np.array([tup for ip in h for tup in np.array(hist_xy(ip, err, raw)).T]).T
+        return [uconcatenate(v) for v in zip(*[hist_xy(ip, err, raw) for ip in h])]
     return bins.from_hist(h, err, raw), hist_values(h, err)
 
 
 def hist_values_2d(h, err=True, flat=True, z_sup=True):
-    xbins, ybins = bins.hn(h, axis='X'), bins.hn(h, axis='Y')
-    values = np.array([ufloat(h.GetBinContent(xbin, ybin), h.GetBinError(xbin, ybin)) for ybin in ybins for xbin in xbins])
-    values = values if err else np.array([v.n for v in values])
-    return (values[values != 0] if z_sup else values) if flat else values.reshape(len(ybins), len(xbins))
+    v, e = [a.reshape(h.GetNbinsY() + 2, h.GetNbinsX() + 2)[1:-1, 1:-1].flatten() for a in cell_values(h)]
+    values = arr2u(v, e) if err else v
+    return (values[v != 0] if z_sup else values) if flat else values.reshape(h.GetNbinsY(), h.GetNbinsX())
 
 
 def hist_xyz(h, err=True, flat=False, z_sup=True, grid=False):
@@ -1187,16 +1570,8 @@ def set_titles(status=True):
 def shift_graph(g, ox=0, oy=0):
     if is_iter(g):
         return [shift_graph(ig, ox, oy) for ig in g]
-    if 'Asym' in g.ClassName():
-        x, y = graph_xy(g, as_u=False)
-        for i in range(x.shape[0]):
-            g.SetPoint(i, x[i][0] + ox, y[i][0] + oy)
-            g.SetPointError(i, *x[i][1:], *y[i][1:])
-    else:
-        for i, (x, y) in enumerate(array(graph_xy(g)).T + [ox, oy]):
-            g.SetPoint(i, x.n, y.n)
-            if 'Error' in g.ClassName():
-                g.SetPointError(i, x.s, y.s)
+    for i, (x, y) in enumerate(np.array(graph_xy(g, err=False)).T + [ox, oy]):
+        g.SetPoint(i, x, y)  # the errors of the points are not affected
     return g
 
 
@@ -1264,6 +1639,7 @@ def is_graph(h):
     return 'Graph' in h.ClassName()
 
 
+@Prof.timed('update canvas')
 def update_canvas(c=None):
     c = choose(c, get_last_canvas(warn=False))
     if c is not None:
@@ -1296,13 +1672,13 @@ def show_line_styles():
 
 
 def ax_range(low: Any = None, high=None, fl=0., fh=0., h=None, to_int=False, thresh=None):
-    if type(low) in [list, np.ndarray]:
-        utypes = [Variable, AffineScalarFunc]
+    if type(low) in [list, np.ndarray, UArray]:
         if len(low) == 2 and not is_ufloat(low[0]):
             return ax_range(low[0], low[1], fl, fh)
         m, s = mean_sigma(low, err=0)
-        v = low[np.absolute(low - m) < thresh * s] if thresh is not None else low
-        return ax_range(min(v).n if type(v[0]) in utypes else min(v), max(v).n if type(v[0]) in utypes else max(v), fl, fh, to_int=to_int)
+        v = make_darray(low)
+        v = v[np.abs(v - m) < thresh * s] if thresh is not None else v
+        return ax_range(min(v), max(v), fl, fh, to_int=to_int)
     if h is not None:
         lo, hi = choose(thresh, low), choose(thresh, high)
         if 'TH2' in h.ClassName() or '2D' in h.ClassName():
@@ -1406,10 +1782,8 @@ def set_time_axis(histo, form='%H:%M', off=0, axis='X'):
 
 def find_mpv_fwhm(histo, nbins=15):
     max_bin = histo.GetMaximumBin()
-    fit = TF1('fit', 'gaus', 0, 500)
-    histo.Fit('fit', 'qs0', '', histo.GetBinCenter(max_bin - nbins), histo.GetBinCenter(max_bin + nbins))
-    mpv = ufloat(fit.GetParameter(1), fit.GetParError(1))
-    fwhm = histo.FindLastBinAbove(fit(mpv.n) / 2) - histo.FindFirstBinAbove(fit(mpv.n) / 2)
+    c, mpv = Draw.Fits.fit(histo, 'gaus', 'qs0', histo.GetBinCenter(max_bin - nbins), histo.GetBinCenter(max_bin + nbins))[:2]
+    fwhm = histo.FindLastBinAbove(c.n / 2) - histo.FindFirstBinAbove(c.n / 2)  # the maximum of the gaussian is its constant
     return mpv, fwhm, mpv / fwhm
 
 
@@ -1423,7 +1797,7 @@ def find_mpv(h, r=.8, show_fit=False):
     bmax, ymax = (b[-1] + 1, y[-1]) if y[-1] < 2 * y[-2] else (b[-2] + 1, y[-2])
     fit_range = [f(ymax * r) for f in [h.FindFirstBinAbove, h.FindLastBinAbove]]
     fit_range = fit_range if np.diff(fit_range)[0] > 5 else (bmax + np.array([-5, 5])).tolist()
-    yfit, xfit = FitRes(h.Fit('gaus', f'qs{"" if show_fit else"0"}', '', *[h.GetBinCenter(i) for i in fit_range]))[:2]  # fit the top with a gaussian to get better maxvalue
+    yfit, xfit = Draw.Fits.fit(h, 'gaus', f'qs{"" if show_fit else"0"}', *[h.GetBinCenter(i) for i in fit_range])[:2]  # fit the top with a gaussian to get better maxvalue
     return (xfit, yfit) if abs(yfit - ymax) < .2 * ymax else (h.GetBinCenter(int(bmax)) + ufloat(0, h.GetBinWidth(1) / 2), ymax * ufloat(1, .02))  # check if fit value is reasonable ...
 
 
@@ -1442,7 +1816,7 @@ def _get_fwhm(h, half_max):
 
 def fit_fwhm(h, fitfunc='gaus', show=False, fit_range=.8):
     low, high = get_fwhm(h, fit_range, ret_edges=True)
-    return FitRes(h.Fit(fitfunc, 'qs{}'.format('' if show else 0), '', low.n, high.n))
+    return Draw.Fits.fit(h, fitfunc, 'qs{}'.format('' if show else 0), low.n, high.n)
 
 
 def get_f_fwhm(f: TF1):
@@ -1536,7 +1910,12 @@ def is_root_object(o):
     return hasattr(o, 'GetName')
 
 
+def is_profile(h):
+    return any([h.InheritsFrom(cls) for cls in ['TProfile', 'TProfile2D', 'TProfile3D']])
+
+
 def np_profile(x, y, u=False):
+    from scipy.stats import binned_statistic  # slow import, rarely needed
     with catch_warnings():
         simplefilter("ignore")
         m, s, n = [binned_statistic(x, y.astype('d'), bins=bins.n(x), statistic=stat) for stat in ['mean', 'std', 'count']]
@@ -1,22 +1,34 @@
 #!/usr/bin/env python
 from ROOT import TF1, Math, TMath
-from numpy import exp
+from ctypes import c_double
+from functools import partial
+from inspect import ismethod, ismodule, signature
+
+import numpy as np
+from numpy import exp, linspace, sign
+from scipy.optimize import least_squares
 from scipy.special import erf
+from scipy.stats import poisson
 
+from . import binning as bins
+from . import cpp
 from .draw import *
+from .utils import *
 
 
 class Fit(object):
     """ general class to perform fits on a histgram"""
-    def __init__(self, name='fit', h=None, fit_range=None, npx=1000, invert=False, par_names=None):
+
+    Backend = 'root'  # or 'scipy' to fit the arrays of the histogram without ROOT
+    Tolerance = .01  # repeated fits stop if no parameter changes by more than this fraction of its error
+
+    def __init__(self, name='fit', h=None, fit_range=None, npx=1000, invert=False, par_names=None, seed=None):
         self.Name = name
-        self.Histo = h
+        self.Seed = None if seed is None else np.array(uarr2n(seed.Pars if isinstance(seed, FitRes) else seed), 'd')
         self.Draw = Draw(join(BaseDir, 'config', 'main.ini'))
 
         # Range and Values
-        self.XMin, self.XMax = choose(fit_range, self.find_fit_range)
-        if h is not None:
-            self.X, self.Values = h_xy(h)
+        self.set_data(h, fit_range)
 
         # Fit
         self.ParNames = choose(par_names, self.get_par_names())
@@ -28,6 +40,7 @@ class Fit(object):
         self.set_par_names()
         self.set_par_limits()
         self.set_start_values()
+        self.set_seed()
 
     def __call__(self, *args, **kwargs):
         return self.fit(*args, **kwargs)
@@ -45,6 +58,21 @@ class Fit(object):
         except StopIteration:
             return
 
+    def set_data(self, h, fit_range=None):
+        """ sets the histogram [h] and everything derived from it: the fit range and the values. """
+        self.Histo = h
+        self.XMin, self.XMax = choose(fit_range, self.find_fit_range)
+        if h is not None:
+            self.X, self.Values = h_xy(h)
+
+    def set_histo(self, h, fit_range=None):
+        """ reuses the fit for another histogram [h] with the limits and start values derived from its data. """
+        self.set_data(h, fit_range)
+        self.Fit.SetRange(self.XMin, self.XMax)
+        self.set_par_limits()
+        self.set_start_values()
+        self.set_seed()
+
     def clear_old(self):
         old = get_object(self.Name)
         if old:
@@ -71,6 +99,13 @@ class Fit(object):
     def set_start_values(self):
         pass
 
+    def set_seed(self):
+        """ uses the parameters of a previous fit (e.g. of a similar histogram) as start values, within the limits and keeping fixed parameters. """
+        if self.Seed is not None:
+            (lo, hi), fixed = self.get_par_limits()
+            p = np.array([self.Fit.GetParameter(i) for i in range(self.Fit.GetNpar())])
+            self.Fit.SetParameters(np.where(fixed, p, np.clip(self.Seed, lo, hi)))
+
     def get_chi2(self):
         return self.Fit.GetChisquare() / self.Fit.GetNDF()
 
@@ -92,21 +127,108 @@ class Fit(object):
             Draw.vertical_line(t0, -100, 1e5)
         return t1 - t0
 
-    def fit(self, n=1, draw=True, minuit=True, fl=0, fh=0):
+    def fit(self, n=1, draw=True, minuit=True, fl=0, fh=0, backend=None, lh=False):
+        fid = self.get_id()
+        key = None if fid is None else Draw.Fits.key(self.Histo, fid, n, minuit, fl, fh, choose(backend, self.Backend), lh)
+        res = None if key is None else Draw.Fits.get(key)
+        if res is not None:  # same data, function, start values and options
+            self.set_result(res.Pars, res.Errors, res.vChi2, res.vNdf)
+            self.draw_fit() if draw else do_nothing()
+            return FitRes(self.Fit)
+        if choose(backend, self.Backend) == 'scipy':
+            return self.cache(key, self.np_fit(draw, fl, fh, lh))
         if minuit:
             Math.MinimizerOptions.SetDefaultMinimizer('Minuit2', 'Migrad')
+        opt, p = f'qs{"l" if lh else ""}{"" if draw else 0}{"" if self.Seed is None else "b"}', None  # B: use the start values also for predefined functions
         for _ in range(n):
-            set_root_output(0)
-            self.Histo.Fit(self.Fit, f'qs{"" if draw else 0}', '', *ax_range(self.XMin, self.XMax, fl, fh))
-        set_root_output(True)
-        if draw:
-            self.Fit.Draw('same')
-            update_canvas()
-        return FitRes(self.Fit)
+            Draw.set_show(False)
+            self.Histo.Fit(self.Fit, opt, '', *ax_range(self.XMin, self.XMax, fl, fh))
+            p, p0 = np.array([self.Fit.GetParameter(i) for i in range(self.Fit.GetNpar())]), p
+            if p0 is not None and self.converged(p0, p):
+                break
+        Draw.set_show(True)
+        self.draw_fit() if draw else do_nothing()
+        return self.cache(key, FitRes(self.Fit))
+
+    @staticmethod
+    def cache(key, res):
+        return res if key is None else Draw.Fits.add(key, res)
+
+    def converged(self, p0, p):
+        e = np.array([self.Fit.GetParError(i) for i in range(self.Fit.GetNpar())])
+        return np.all(np.abs(p - p0) <= self.Tolerance * np.maximum(e, 1e-9 * np.abs(p)))
+
+    def draw_fit(self):
+        self.Fit.Draw('same')
+        update_canvas()
+
+    def get_id(self):
+        """ :returns: the properties of the fit function, which determine the result together with the data, None if the function cannot be identified """
+        fid = self.Fit.GetExpFormula().Data() or self.callback_id()  # TF1s of python callbacks have no formula
+        if not fid:
+            return
+        return [self.__class__.__name__, fid, self.Invert, self.XMin, self.XMax, [self.Fit.GetParameter(i) for i in range(self.Fit.GetNpar())],
+                *[a.tolist() for a in self.get_par_limits()]]
+
+    def callback_id(self):
+        """ :returns: identity of the python function of the TF1, None if it is unknown """
+        return None
+
+    def set_result(self, pars, errors, chi2, ndf):
+        self.Fit.SetParameters(np.array(pars, 'd'))
+        self.Fit.SetParErrors(np.array(errors, 'd'))
+        self.Fit.SetChisquare(chi2)
+        self.Fit.SetNDF(ndf)
 
     def draw(self, *args, **kwargs):
         self.Draw.function(self.Fit, self.Name, *args, **prep_kw(kwargs, x_tit='x', y_tit='y'))
 
+    # ----------------------------------------
+    # region SCIPY
+    def model(self, x, *pars):
+        """ numpy version of the fit function, the base class evaluates the TF1 point by point. """
+        self.Fit.SetParameters(np.array(pars, 'd'))
+        return np.array([self.Fit.Eval(i) for i in x])
+
+    def get_model(self):
+        """ :returns: the numpy model f(x, *pars) and its analytic derivatives with shape (x.size, npar) or None to use finite differences.
+            Subclasses return module level functions, which can be sent to worker processes. """
+        return self.model, None
+
+    def get_data(self, fl=0, fh=0):
+        """ :returns: x, y and the errors of y of the histogram or graph within the fit range """
+        h, (xmin, xmax) = self.Histo, ax_range(self.XMin, self.XMax, fl, fh)
+        if h.InheritsFrom('TH1'):
+            x, (y, ey) = bins.from_hist(h, err=False), hist_values(h, as_u=False).T
+        else:
+            x, y = graph_x(h, err=False), graph_y(h, as_u=False)
+            y, ey = (y[:, 0], y[:, 1:].mean(axis=1)) if y.ndim > 1 else (y, np.ones(y.size))  # ROOT uses errors of 1 for graphs without errors
+        cut = (x >= xmin) & (x <= xmax)
+        return x[cut], y[cut], ey[cut]
+
+    def get_par_limits(self):
+        """ :returns: lower and upper limits and a mask of the fixed parameters of the TF1 (the same convention as ROOT) """
+        lim = np.zeros((self.Fit.GetNpar(), 2))
+        for i in range(lim.shape[0]):
+            lo, hi = c_double(), c_double()
+            self.Fit.GetParLimits(i, lo, hi)
+            lim[i] = lo.value, hi.value
+        fixed = (lim[:, 0] * lim[:, 1] != 0) & (lim[:, 0] >= lim[:, 1])
+        lim[lim[:, 0] >= lim[:, 1]] = -np.inf, np.inf
+        return lim.T, fixed
+
+    def np_fit(self, draw=True, fl=0, fh=0, lh=False):
+        """ fits the arrays of the histogram with scipy and writes the result into the TF1. """
+        x, y, ey = self.get_data(fl, fh)
+        bounds, fixed = self.get_par_limits()
+        p0, (f, jac) = [self.Fit.GetParameter(i) for i in range(self.Fit.GetNpar())], self.get_model()
+        self.set_result(*np_fit(f, x, y, ey, p0, bounds, fixed, lh, jac))
+        self.Fit.SetRange(*ax_range(self.XMin, self.XMax, fl, fh))
+        self.draw_fit() if draw else do_nothing()
+        return FitRes(self.Fit)
+    # endregion SCIPY
+    # ----------------------------------------
+
     @property
     def formula(self):
         return self.Fit.GetFormula().GetTitle()
@@ -118,25 +240,44 @@ def make_fit(h, f, xmin=0, xmax=1, start_values=None, par_names=None, name=None,
             Fit.__init__(self, choose(name, 'NewFit'), h, [xmin, xmax], npx, par_names=par_names)
 
         def init_fit(self):
+            if cpp.formula(f) is not None:
+                return self.Draw.make_f(self.Name, cpp.formula(f), self.XMin, self.XMax, start_values)
             n_par = len(signature(f).parameters) - 1
             tmp = lambda x, pars: (f(x, pars[0]) if n_par == 1 else f(x, pars[0], pars[1]) if n_par == 2 else f(x, pars[0], pars[1], pars[2]))
             return self.Draw.make_tf1(self.Name, tmp, self.XMin, self.XMax, pars0=start_values)
 
+        def callback_id(self):
+            return function_id(f)
+
     return NewFit()
 
 
+def function_id(f):
+    """ :returns: identity of the python function [f] from its name, code and captured values, None if they have no stable representation """
+    f = getattr(f, '__func__', f)
+    if not hasattr(f, '__code__'):
+        return
+    c = f.__code__
+    glob = {n: f.__globals__[n] for n in c.co_names if n in f.__globals__ and not callable(f.__globals__[n]) and not ismodule(f.__globals__[n])}
+    values = [f.__defaults__, f.__kwdefaults__, c.co_consts, [cell.cell_contents for cell in f.__closure__ or []], glob]
+    return None if ' at 0x' in repr(values) else [f.__module__, f.__qualname__, c.co_code.hex(), repr(values)]
+
+
 class PoissonI(Fit):
-    def __init__(self, h=None, fit_range=None, npx=1000, p0=None, p1=None):
+    def __init__(self, h=None, fit_range=None, npx=1000, p0=None, p1=None, seed=None):
         self.Pars = [choose(p0, h.GetEntries() if h else 1), choose(p1, 1)]
-        Fit.__init__(self, 'PoissonI', h, choose(fit_range, [0, 30]), npx, par_names=['Consant', 'Lambda'])
+        Fit.__init__(self, 'PoissonI', h, choose(fit_range, [0, 30]), npx, par_names=['Consant', 'Lambda'], seed=seed)
 
     def init_fit(self):
         return self.Draw.make_f(self.Name, '[0] * TMath::PoissonI(x, [1])', self.XMin, self.XMax, self.Pars)
 
+    def get_model(self):
+        return scaled_poisson, None
+
 
 class Expo(Fit):
-    def __init__(self, h=None, xmin=None, xmax=None, npx=100):
-        Fit.__init__(self, 'Exponential', h, None if xmin is None else [xmin, xmax], npx)
+    def __init__(self, h=None, xmin=None, xmax=None, npx=100, seed=None):
+        Fit.__init__(self, 'Exponential', h, None if xmin is None else [xmin, xmax], npx, seed=seed)
 
     def init_fit(self):
         self.XMin, self.XMax = graph_x(self.Histo, err=False)[[0, -1]] if self.XMin == 0 else (self.XMin, self.XMax)
@@ -151,13 +292,16 @@ class Expo(Fit):
     def get_par_names(self):
         return ['asymptote', 'starting value', 'starting time', 'time constant']
 
+    def get_model(self):
+        return expo, expo_jacobian
+
 
 class Gauss(Fit):
-    def __init__(self, h=None, fit_range=None, npx=100, fl=3, fh=3, thresh=.01, **fkw):
+    def __init__(self, h=None, fit_range=None, npx=100, fl=3, fh=3, thresh=.01, seed=None, **fkw):
         self.Fl, self.Fh = fl, fh
         self.Format = fkw
         self.T = thresh
-        Fit.__init__(self, 'Gauss', h, fit_range, npx)
+        Fit.__init__(self, 'Gauss', h, fit_range, npx, seed=seed)
 
     def init_fit(self):
         return self.Draw.make_f(Draw.get_name('gau'), 'gaus', *ax_range(self.XMin, self.XMax, self.Fl, self.Fh), **self.Format)
@@ -168,11 +312,14 @@ class Gauss(Fit):
             ymax = h.GetMaximum()
             return [h.GetBinCenter(f(self.T * ymax)) for f in [h.FindFirstBinAbove, h.FindLastBinAbove]]
 
+    def get_model(self):
+        return gauss, gauss_jacobian
+
 
 class Landau(Fit):
-    def __init__(self, h=None, fit_range=None, npx=100):
+    def __init__(self, h=None, fit_range=None, npx=100, seed=None):
         self.XOff = -.22278
-        Fit.__init__(self, 'Landau', h, fit_range, npx)
+        Fit.__init__(self, 'Landau', h, fit_range, npx, seed=seed)
         self.NPars = self.Fit.GetNpar()
 
     def init_fit(self):
@@ -182,11 +329,14 @@ class Landau(Fit):
         f = self.fit(draw=draw, minuit=False)
         return f[1] + self.XOff * f[2]
 
+    def get_model(self):
+        return scaled_landau, None
+
 
 class Erf(Fit):
-    def __init__(self, h=None, fit_range=None, pars=None, npx=100):
+    def __init__(self, h=None, fit_range=None, pars=None, npx=100, seed=None):
         self.Pars = pars
-        Fit.__init__(self, 'Error Function', h, fit_range, npx)
+        Fit.__init__(self, 'Error Function', h, fit_range, npx, seed=seed)
 
     def init_fit(self):
         return self.Draw.make_f(Draw.get_name('erf'), '[0] + [1] * TMath::Erf((x - [2]) / [3])', self.XMin, self.XMax, pars=choose(self.Pars, [0, 1, 0, 1]))
@@ -194,6 +344,9 @@ class Erf(Fit):
     def get_par_names(self):
         return ['mean', 'spread', 'inflexion', 'width']
 
+    def get_model(self):
+        return error_function, error_function_jacobian
+
     def set_start_values(self):
         if self.Histo is not None:
             x, y = graph_xy(self.Histo, err=False)
@@ -202,20 +355,23 @@ class Erf(Fit):
 
 
 class Crystalball(Fit):
-    def __init__(self, h=None, fit_range=None, inv=False, npx=1000):
+    def __init__(self, h=None, fit_range=None, inv=False, npx=1000, seed=None):
         """ :parameter:  0 - scale, 1 - alpha, 2 - n, 3 - mean, 4 - sigma, 5 - offset """
-        Fit.__init__(self, 'cystalball', h, fit_range, npx, inv)
+        Fit.__init__(self, 'cystalball', h, fit_range, npx, inv, seed=seed)
 
     def get_par_names(self):
         return ['c', 'alpha', 'n', 'mean', 'sigma', 'offset']
 
     def init_fit(self):
-        return TF1(self.Name, partial(crystalball, inv=self.Invert), self.XMin, self.XMax, self.NPars)
+        return self.Draw.make_tf1(self.Name, crystalball, self.XMin, self.XMax, self.NPars, inv=self.Invert)
 
     def draw(self, c=1, alpha=1, n=1, m=20, sigma=2, off=0):
         self.Fit.SetParameters(c, alpha, n, m, sigma, off)
         Draw.histo(self.Fit)
 
+    def get_model(self):
+        return partial(unpacked, f=crystalball, inv=self.Invert), None
+
     def set_par_limits(self):
         if self.Histo is not None:
             maxval = max(self.Values).n
@@ -230,15 +386,15 @@ class Crystalball(Fit):
 
 
 class ErfLand(Fit):
-    def __init__(self, h=None, fit_range=None, npx=1000):
+    def __init__(self, h=None, fit_range=None, npx=1000, seed=None):
         """ :parameter:  0 - erf-scale, 1 - alpha, 2 - n, 3 - mean, 4 - sigma, 5 - offset """
-        Fit.__init__(self, 'erfland', h, fit_range, npx)
+        Fit.__init__(self, 'erfland', h, fit_range, npx, seed=seed)
 
     def set_par_names(self):
         return ['landau-scale', 'mpv', 'sigma', 'erf-scale', 'xoff', 'width', 'offset', 'x0']
 
     def init_fit(self):
-        return TF1(self.Name, erfland, self.XMin, self.XMax, 8)
+        return self.Draw.make_tf1(self.Name, erfland, self.XMin, self.XMax, 8)
 
     def draw(self, c0=1, mpv=7, sigma=2, c1=1, xoff=3, w=2, yoff=0):
         self.Fit.SetParameters(c0, mpv, sigma, c1, xoff, w, yoff)
@@ -247,6 +403,9 @@ class ErfLand(Fit):
     def get_rise_time(self, p=.1, show=False):
         return self._get_rise_time(p, show, off_par=6)
 
+    def get_model(self):
+        return partial(unpacked, f=erfland), None
+
     def set_par_limits(self):
         if self.Histo is not None:
             maxval = max(self.Values).n
@@ -265,15 +424,17 @@ class ErfLand(Fit):
 
 
 class Langau(Fit):
-    def __init__(self, h=None, nconv=100, fit_range=None, npx=1000):
+    def __init__(self, h=None, nconv=100, fit_range=None, npx=1000, seed=None):
 
         self.NConvolutions = nconv
         self.NSigma = 5.
-        Fit.__init__(self, 'langau', h, fit_range, npx)
-        self.XMin, self.XMax = [k * self.Histo.GetMean() for k in [.1, 3]] if fit_range is None else fit_range
+        Fit.__init__(self, 'langau', h, fit_range, npx, seed=seed)
 
     def init_fit(self):
-        return Draw.make_tf1(self.Name, langau, 0, self.get_x_max() * 3, [1] * self.NPars, nconv=self.NConvolutions, nsigma=self.NSigma)
+        return self.Draw.make_f(self.Name, cpp.langau(self.NConvolutions, self.NSigma), 0, self.get_x_max() * 3, [1] * self.NPars)
+
+    def find_fit_range(self):
+        return [k * self.Histo.GetMean() for k in [.1, 3]]
 
     def get_par_names(self):
         return ['Width', 'MPV', 'Area', 'GSigma']
@@ -287,6 +448,8 @@ class Langau(Fit):
         self.Fit.SetParameters(sigma / 5, self.get_x_max(), self.Histo.Integral() * 500, sigma)
 
     def estimate_sigma(self):
+        if self.Seed is not None:
+            return self.Seed[3]
         fit = self.Histo.Fit('gaus', 'qs0', '', *array([.7, 1.3]) * self.get_x_max())
         return fit.Parameter(2)
 
@@ -296,15 +459,18 @@ class Langau(Fit):
     def get_mpv(self):
         return self.get_parameter(1)
 
+    def get_model(self):
+        return partial(unpacked, f=langau, nconv=self.NConvolutions, nsigma=self.NSigma), None
+
 
 class NLandau(Fit):
 
-    def __init__(self, h=None, fit_range=None, npx=100, n=3):
+    def __init__(self, h=None, fit_range=None, npx=100, n=3, seed=None):
         self.MPV = find_mpv_fwhm(h)[0].n
         self.Max = h.GetMaximum()
         self.W = get_fwhm(h).n / 2
         self.N = n
-        super().__init__('TripleLandau', h, fit_range, npx)
+        super().__init__('TripleLandau', h, fit_range, npx, seed=seed)
 
     def init_fit(self):
         return TF1('TripelLandau', ' + '.join('landau({})'.format(3 * i) for i in range(0, self.N)), self.XMin, self.XMax)
@@ -326,61 +492,227 @@ class NLandau(Fit):
             self.Fit.SetParameter(i + 2, self.W)
 
 
+# ----------------------------------------
+# region MODELS
+@cpp.model('rootplots::erfland(x, [0], [1], [2], [3], [4], [5], [6], [7])')
 def erfland(x, pars):
     c0, mpv, sigma, c1, xoff, w, yoff, x0 = [float(p) for p in pars]
-    return yoff + (c0 * TMath.Landau(x[0], mpv, sigma) if x[0] > x0 else c1 * (erf(w * (x[0] - xoff)) + 1))
+    x = np.asarray(x, 'd')
+    return (yoff + np.where(x > x0, c0 * landau(x, mpv, sigma), c1 * (erf(w * (x - xoff)) + 1)))[()]
 
 
 def gauss(x, scale, mean_, sigma, off=0):
     return scale * exp(-.5 * ((x - mean_) / sigma) ** 2) + off
 
 
+@cpp.model(lambda inv=False: f'rootplots::crystalball(x, [0], [1], [2], [3], [4], [5], {int(inv)})')
 def crystalball(x, pars, inv=False):
     scale, alpha, n, m, sigma, off = [float(p) for p in pars]
-    x[0] *= -1 if inv else 1
-    m *= -1 if inv else 1
-    if (x[0] - m) / sigma > -alpha:
-        return gauss(x[0], scale, m, sigma, off)
-    else:
-        a = (n / abs(alpha)) ** n * exp(-abs(alpha) ** 2 / 2)
-        b = n / abs(alpha) - abs(alpha)
-        return scale * a * (b - (x[0] - m) / sigma) ** -n + off
-
-
-def langau(x, pars, nconv, nsigma=5):
-    # Convoluted Landau and Gaussian Fitting Function
-    #         (using ROOT's Landau and Gauss functions)
-    # Fit parameters:
-    # par[0]=Width (scale) parameter of Landau density
-    # par[1]=Most Probable (MP, location) parameter of Landau density
-    # par[2]=Total area (integral -inf to inf, normalization constant)
-    # par[3]=Width (sigma) of convoluted Gaussian function
-
-    # MP shift correction
-    mpshift = -0.22278298  # Landau maximum location
-    mpc = pars[1] - mpshift * pars[0]
-
-    # Range of convolution integral
-    xmin, xmax = [x + i * nsigma * pars[3] for i in [-1, 1]]
-    step = (xmax - xmin) / nconv
-
-    # Variables
-    sum_int = 0.
-    i = 1.
-
-    # Convolution integral of Landau and Gaussian by sum
-    while i <= nconv / 2:
-        xx = xmin + (i - .5) * step
-        fland = TMath.Landau(xx, mpc, pars[0]) / pars[0]
-        sum_int += fland * TMath.Gaus(x, xx, pars[3])
-
-        xx = xmax - (i - .5) * step
-        fland = TMath.Landau(xx, mpc, pars[0]) / pars[0]
-        sum_int += fland * TMath.Gaus(x, xx, pars[3])
+    x, m = (-np.asarray(x, 'd'), -m) if inv else (np.asarray(x, 'd'), m)
+    a, b, t = (n / abs(alpha)) ** n * exp(-abs(alpha) ** 2 / 2), n / abs(alpha) - abs(alpha), (x - m) / sigma
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(t > -alpha, gauss(x, scale, m, sigma, off), scale * a * (b - t) ** -n + off)[()]
 
-        i += 1
 
-    return pars[2] * step * sum_int / sqrt(2 * pi) / pars[3]
+def gauss_jacobian(x, c, m, s):
+    e, u = exp(-.5 * ((x - m) / s) ** 2), (x - m) / s
+    return np.array([e, c * e * u / s, c * e * u ** 2 / s]).T
+
+
+def expo(x, a, c, t0, tau):
+    return a + c * exp(-(x - t0) / tau)
+
+
+def expo_jacobian(x, a, c, t0, tau):
+    e = exp(-(x - t0) / tau)
+    return np.array([np.ones_like(x), e, c * e / tau, c * e * (x - t0) / tau ** 2]).T
+
+
+def error_function(x, m, c, x0, w):
+    return m + c * erf((x - x0) / w)
+
+
+def error_function_jacobian(x, m, c, x0, w):
+    u = (x - x0) / w
+    g = 2 / np.sqrt(np.pi) * exp(-u ** 2) * c / w
+    return np.array([np.ones_like(x), erf(u), -g, -g * u]).T
+
+
+def scaled_landau(x, c, mpv, sigma):
+    return c * landau(x, mpv, sigma)
+
+
+def scaled_poisson(x, c, lam):
+    return c * poisson.pmf(np.trunc(x), lam)  # TMath::PoissonI evaluates the Poisson probability of Int_t(x)
+
+
+def unpacked(x, *pars, f, **kwargs):
+    """ calls the model [f], which takes the parameters as single argument like ROOT callbacks, with the unpacked parameters [pars] """
+    return f(x, pars, **kwargs)
+# endregion MODELS
+# ----------------------------------------
+
+
+# ----------------------------------------
+# region LANDAU
+# rational approximations of the Landau density from CERNLIB (DENLAN), as used in TMath::Landau
+LandauP = np.array([[.4259894875, -.1249762550, .03984243700, -.006298287635, .001511162253],
+                    [.1788541609, .1173957403, .01488850518, -.001394989411, .0001283617211],
+                    [.1788544503, .09359161662, .006325387654, .00006611667319, -.000002031049101],
+                    [.9874054407, 118.6723273, 849.2794360, -743.7792444, 427.0262186],
+                    [1.003675074, 167.5702434, 4789.711289, 21217.86767, -22324.94910],
+                    [1.000827619, 664.9143136, 62972.92665, 475554.6998, -5743609.109]])
+LandauQ = np.array([[1, -.3388260629, .09594393323, -.01608042283, .003778942063],
+                    [1, .7428795082, .3153932961, .06694219548, .008790609714],
+                    [1, .6097809921, .2560616665, .04746722384, .006957301675],
+                    [1, 106.8615961, 337.6496214, 2016.712389, 1597.063511],
+                    [1, 156.9424537, 3745.310488, 9834.698876, 66924.28357],
+                    [1, 651.4101098, 56974.73333, 165917.4725, -2815759.939]])
+LandauEdges = np.array([-5.5, -1, 1, 5, 12, 50, 300])
+
+
+def landau(x, mpv=0., sigma=1.):
+    """ vectorised TMath::Landau(x, mpv, sigma) (not normalised, i.e. the density of the standardised variable) """
+    sigma = np.asarray(sigma, 'd')
+    v = (np.asarray(x, 'd') - mpv) / np.where(sigma > 0, sigma, 1.)  # TMath::Landau is 0 for sigma <= 0
+    i = np.clip(np.searchsorted(LandauEdges, v, side='right') - 1, 0, 5)  # section of the approximation, 0 also for v < -5.5
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+        u = np.where(v < 5, v, 1 / v)
+        r = horner(u, LandauP[i]) / horner(u, LandauQ[i])
+        e = np.exp(-v - 1)
+        r = np.select([v < -5.5, v < -1, v < 5, v < 300], [landau_tail(v), np.exp(-e) * np.sqrt(e) * r, r, r / v ** 2], landau_asymptote(v))
+    return np.where(sigma > 0, r, 0)
+
+
+def horner(u, c):
+    """ :returns: polynomial with the coefficients in the last axis of [c] evaluated at [u] """
+    r = c[..., -1]
+    for i in range(c.shape[-1] - 2, -1, -1):
+        r = r * u + c[..., i]
+    return r
+
+
+def landau_tail(v):
+    u = np.exp(v + 1)
+    return np.where(u < 1e-10, 0, .3989422803 * np.exp(-1 / u) / np.sqrt(u) * (1 + (.04166666667 + (-.01996527778 + .02709538966 * u) * u) * u))
+
+
+def landau_asymptote(v):
+    u = 1 / (v - v * np.log(v) / (v + 1))
+    return u ** 2 * (1 + (-1.845568670 - 4.284640743 * u) * u)
+
+
+def langau_kernel(nconv=100, nsigma=5.):
+    """ :returns: offsets (in units of the Gaussian sigma) and Gaussian weights of the convolution sum """
+    h = (np.arange(1, nconv // 2 + 1) - .5) * 2 * nsigma / nconv
+    t = np.concatenate([nsigma - h, h - nsigma])
+    return t, np.exp(-.5 * t ** 2)
+
+
+def langau(x, pars, nconv=100, nsigma=5.):
+    """ Convolution of the Landau and Gaussian density as a sum over [nconv] points within [nsigma] of the Gaussian, evaluated for all [x] at once.
+        :param pars: [Width (scale) of the Landau density, Most Probable value (MPV), Total area (normalisation constant), Width (sigma) of the Gaussian] """
+    width, mpv, area, sigma = [float(p) for p in pars[:4]]
+    t, g = langau_kernel(nconv, nsigma)
+    mpc = mpv + .22278298 * width  # MP shift correction
+    v = area * 2 * nsigma / nconv * (landau(np.add.outer(np.asarray(x, 'd'), t * sigma), mpc, width) @ g) / width / np.sqrt(2 * np.pi)
+    return v if np.ndim(x) else float(v)
+# endregion LANDAU
+# ----------------------------------------
+
+
+# ----------------------------------------
+# region SCIPY
+def baker_cousins(mu, y):
+    """ :returns: signed square roots of the terms of the Baker-Cousins likelihood chi2 of the Poisson counts [y] for the expectation [mu] """
+    mu = np.maximum(mu, 1e-12)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d = mu - y + np.where(y > 0, y * np.log(y / mu), 0)
+    return np.sign(mu - y) * np.sqrt(2 * np.maximum(d, 0))
+
+
+def baker_cousins_derivative(mu, y, r):
+    """ :returns: derivative of the residuals [r] with respect to [mu], which is 1 / sqrt(y) in the limit mu -> y """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(np.abs(r) > 1e-8, (1 - y / np.maximum(mu, 1e-12)) / r, 1 / np.sqrt(np.maximum(y, 1e-12)))
+
+
+def np_fit(f, x, y, ey, p0, bounds=None, fixed=None, lh=False, jac=None):
+    """ binned least-squares fit (or Poisson likelihood fit with the Baker-Cousins chi2 for [lh]) of the model f(x, *pars) with scipy.
+        Bins without error are ignored in the least-squares fit as in ROOT. The errors are taken from the Gauss-Newton approximation of the Hessian.
+        :returns: parameters, errors, chi2, ndf """
+    p0 = np.array(p0, 'd')
+    fixed = np.zeros(p0.size, bool) if fixed is None else np.asarray(fixed)
+    free, (lo, hi) = ~fixed, (np.full((2, p0.size), [[-np.inf], [np.inf]]) if bounds is None else np.asarray(bounds, 'd'))
+    x, y, ey = [np.asarray(i, 'd') for i in [x, y, ey]]
+    x, y, ey = (x, y, ey) if lh else (x[ey > 0], y[ey > 0], ey[ey > 0])
+
+    def pars(q):
+        p = p0.copy()
+        p[free] = q
+        return p
+
+    def residuals(q):
+        mu = f(x, *pars(q))
+        return baker_cousins(mu, y) if lh else (mu - y) / ey
+
+    def jacobian(q):
+        j = jac(x, *pars(q))[:, free]
+        if lh:
+            mu = f(x, *pars(q))
+            return j * baker_cousins_derivative(mu, y, baker_cousins(mu, y))[:, None]
+        return j / ey[:, None]
+
+    r = least_squares(residuals, np.clip(p0[free], lo[free], hi[free]), jac='2-point' if jac is None else jacobian, bounds=(lo[free], hi[free]))
+    errors = np.zeros(p0.size)
+    errors[free] = np.sqrt(np.abs(np.diag(np.linalg.pinv(r.jac.T @ r.jac))))
+    return pars(r.x), errors, 2 * r.cost, int(y.size - free.sum())
+
+
+def fit_task(task, f, jac=None, lh=False):
+    x, y, ey, p0, bounds, fixed = task
+    try:
+        return np_fit(f, x, y, ey, p0, bounds, fixed, lh, jac)
+    except (ValueError, np.linalg.LinAlgError):  # e.g. not enough points or non-finite residuals
+        return np.full(len(p0), np.nan), np.full(len(p0), np.nan), np.nan, 0
+
+
+def fit_batch(fit, hists=None, x=None, y=None, ey=None, p0=None, lh=False, fit_range=None, workers=None, processes=True):
+    """ fits the same model to many histograms with the scipy backend in a process pool.
+        :param fit: Fit class or instance, which is created only once and reset to the data, range, limits and start values of each histogram in [hists],
+                    or the numpy model f(x, *pars) (or a tuple with its jacobian) to fit the rows of the stacked bin contents [y] with the bin centres [x]
+        :returns: parameters, errors and chi2 / ndf with one row per histogram (NaN for failed fits) """
+    if hists is not None:
+        fit = fit(hists[0]) if isinstance(fit, type) else fit
+        tasks = []
+        for h in hists:
+            fit.set_histo(h, fit_range)
+            tasks.append([*fit.get_data(), [fit.Fit.GetParameter(i) for i in range(fit.Fit.GetNpar())], *fit.get_par_limits()])
+    else:
+        y = np.atleast_2d(np.asarray(y, 'd'))
+        ey = np.sqrt(y) if ey is None else np.broadcast_to(ey, y.shape)
+        p0 = np.broadcast_to(p0, (y.shape[0], np.size(p0) if np.ndim(p0) == 1 else np.shape(p0)[1]))
+        tasks = [[x, iy, iey, ip0, None, None] for iy, iey, ip0 in zip(y, ey, p0)]
+    f, jac = fit.get_model() if isinstance(fit, Fit) else fit if type(fit) is tuple else (fit, None)
+    task = partial(fit_task, f=f, jac=jac, lh=lh)
+    workers = choose(workers, Draw.Workers)
+    serial = workers < 2 or ismethod(f)  # bound models evaluate the shared TF1 of the fit, which must not be used by several threads
+    res = [task(t) for t in tasks] if serial else bins.pool_map(task, tasks, workers, processes)
+    pars, errors, chi2, ndf = [np.array(i, 'd') for i in zip(*res)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return pars, errors, chi2 / ndf
+
+
+def fit_series(cls, hists, *args, seed=None, **kwargs):
+    """ fits the histograms [hists] in order with the Fit class [cls], each started from the result of the previous one (warm start).
+        :returns: list of the fit results """
+    res = []
+    for h in hists:
+        seed = cls(h, *args, seed=seed, **kwargs).fit(draw=False)
+        res.append(seed)
+    return res
+# endregion SCIPY
+# ----------------------------------------
 
 
 def langaupro(params, maxx, FWHM):
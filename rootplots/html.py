@@ -9,7 +9,7 @@ from subprocess import Popen
 from typing import Any
 from pytz import timezone, utc
 
-from .utils import BaseDir, warning, info, add_spaces, is_iter, datetime, choose
+from .utils import BaseDir, warning, info, add_spaces, is_iter, datetime, choose, Prof
 
 
 def tag(name, txt, *opts_):
@@ -88,6 +88,7 @@ def create_tree(p: Path):
     Popen(f'tree {p.parent} -H . --charset utf-8 -P "*.html" -o {p}', shell=True)
 
 
+@Prof.timed('html')
 def create_root_overview(p: Path, x=3, y=2, verbose=None):
     f = File(str(p.with_suffix('.html')))
     head = File()
@@ -293,11 +294,19 @@ class File:
         self.T = self.Header = self.Body = self.Scripts = ''
 
 
-ROOTHTML = make_root_html()
+ROOTHTML = None  # template of the plot pages, created on first use
 
 
+def root_html():
+    global ROOTHTML
+    ROOTHTML = make_root_html() if ROOTHTML is None else ROOTHTML
+    return ROOTHTML
+
+
+@Prof.timed('html')
 def create_root(file_path: Path, title='', draw_opt='colz', pal=55, verbose=None):
     f = File(str(file_path))
-    f.set_body(ROOTHTML.Body.format(pal=pal, plot_file='plots.root', plot_name=file_path.stem, draw_opt=draw_opt))
-    f.set_header(ROOTHTML.Header.format(title=f'{add_spaces(file_path.stem).title()} {title}'))
+    t = root_html()
+    f.set_body(t.Body.format(pal=pal, plot_file='plots.root', plot_name=file_path.stem, draw_opt=draw_opt))
+    f.set_header(t.Header.format(title=f'{add_spaces(file_path.stem).title()} {title}'))
     f.save(verbose=verbose)
@@ -6,7 +6,7 @@
 
 from os import chdir
 from subprocess import check_output
-from .utils import warning
+from .utils import warning, Prof
 
 
 class Info(object):
@@ -36,6 +36,7 @@ class Info(object):
     def draw_legend(self):  # noqa
         return False
 
+    @Prof.timed('info')
     def draw(self, canvas=None, all_pads=True):
         """ draws the active information on the canvas """
         if not self.is_active():
@@ -4,26 +4,166 @@
 # created on September 25th 2020 by M. Reichmann (remichae@phys.ethz.ch)
 # --------------------------------------------------------
 
-from ROOT import TFile
+from atexit import register
+from concurrent.futures import ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from functools import partial
+from hashlib import blake2b
+from importlib import import_module
+from itertools import chain
+from json import dumps, loads
+from multiprocessing import get_context
+from pickle import dumps as pdumps, loads as ploads
+
+import numpy as np
+from ROOT import TFile, TObject, gROOT
 
 from . import html
 from .draw import *
-from .utils import BaseDir
+from .utils import *
+
+__all__ = ['PlotCache', 'SaveDraw', 'render', 'load_manifest', 'export_plot', 'export', 'map_plots']
+
+
+class PlotCache(object):
+    """ content-addressed cache of the saved plots: an index in [directory] maps each saved file to the hash of the drawn object and its drawing options
+        and the canvas of each hash is kept as ROOT file. The least recently used canvases are removed if they exceed [size] MB in total. """
+
+    ReadOnly = False  # set in worker processes, which leave writing the index to the parent process
+
+    def __init__(self, directory, size=500):
+        self.Dir = Path(directory).joinpath('.plots')
+        self.Size = size * 2 ** 20
+        self.IndexFile = self.Dir.joinpath('index.json')
+        self.Index = loads(self.IndexFile.read_text()) if self.IndexFile.exists() else {}
+        self.Bytes = sum(self.file(key).stat().st_size for key in {d['key'] for d in self.Index.values()} if self.file(key).exists())  # running total of the canvas files
+        self.Modified = False  # the access times of cache hits are only written with the next plot or at exit
+        register(self.flush)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}: {len(self.Index)} plots, {self.disk_size / 2 ** 20:.1f}/{self.Size / 2 ** 20:.0f} MB in {self.Dir}'
+
+    @staticmethod
+    def key(h, *args):
+        """ :returns: hash of the values, binning, titles, style and functions of the histogram or graph [h] and the drawing options [args], None if they cannot be hashed. """
+        if PlotCache.hashable(h):
+            k = blake2b(FitCache.key(h, h.GetTitle(), *[ax.GetTitle() for ax in [h.GetXaxis(), h.GetYaxis()] if ax], *PlotCache.attributes(h)).encode(), digest_size=16)
+            try:
+                PlotCache.update(k, args)
+                return k.hexdigest()
+            except TypeError:
+                return
+
+    @staticmethod
+    def attributes(h):
+        """ :returns: the line, marker and fill attributes of [h] and the attached functions with their parameters, e.g. of a fit """
+        style = [getattr(h, f'Get{a}')() for a in ['LineColor', 'LineStyle', 'LineWidth', 'MarkerColor', 'MarkerStyle', 'MarkerSize', 'FillColor', 'FillStyle']]
+        funcs = [[f.ClassName(), f.GetName()] + ([f.GetExpFormula().Data(), f.GetXmin(), f.GetXmax(), [f.GetParameter(i) for i in range(f.GetNpar())]] if f.InheritsFrom('TF1') else [])
+                 for f in h.GetListOfFunctions()]
+        return style, funcs
+
+    @staticmethod
+    def hashable(obj):
+        return hasattr(obj, 'InheritsFrom') and (obj.InheritsFrom('TH1') or obj.InheritsFrom('TGraph'))
+
+    @staticmethod
+    def update(k, v):
+        """ adds the content of the option [v] to the hash [k]. Arrays and histograms are hashed by their data, since their repr is truncated or contains the address.
+            :raises TypeError: for objects without a stable representation """
+        if isinstance(v, (list, tuple)):
+            k.update(f'{type(v).__name__}{len(v)}'.encode())
+            for i in v:
+                PlotCache.update(k, i)
+        elif isinstance(v, dict):
+            PlotCache.update(k, sorted(v.items(), key=lambda i: str(i[0])))
+        elif isinstance(v, np.ndarray):
+            k.update(f'{v.dtype}{v.shape}'.encode())
+            k.update(np.ascontiguousarray(v).tobytes() if v.dtype != object else repr(v.tolist()).encode())
+        elif PlotCache.hashable(v):
+            k.update(FitCache.key(v, v.GetTitle()).encode())
+        elif callable(v) and hasattr(v, '__qualname__'):
+            k.update(f'{v.__module__}.{v.__qualname__}'.encode())
+        elif hasattr(v, 'InheritsFrom') or ' at 0x' in repr(v):
+            raise TypeError(f'cannot hash {type(v).__name__}')
+        else:
+            k.update(repr(v).encode())
+
+    def file(self, key):
+        return self.Dir.joinpath(f'{key}.root')
+
+    @property
+    def disk_size(self):
+        return self.Bytes
+
+    def get(self, path, key):
+        """ :returns: the canvas of the plot [path] if it was saved from the same object with the same options, None otherwise. """
+        d = self.Index.get(str(path))
+        if key is None or d is None or d['key'] != key or not all([Path(f).exists() for f in [self.file(key), *d['files']]]):
+            return
+        d0, f = gROOT.CurrentDirectory(), TFile(str(self.file(key)))
+        c = f.Get('c')
+        f.Close()
+        d0.cd()
+        d['time'], self.Modified = time(), True
+        return c
+
+    def add(self, path, key, canvas, files):
+        if key is not None:
+            ensure_dir(self.Dir)
+            if not self.file(key).exists():
+                d0, f = gROOT.CurrentDirectory(), TFile(str(self.file(key)), 'RECREATE')
+                canvas.Write('c')
+                f.Close()
+                d0.cd()
+                self.Bytes += self.file(key).stat().st_size
+            self.Index[str(path)] = {'key': key, 'files': [str(i) for i in files], 'time': time()}
+            self.evict()
+            self.save()
+
+    def evict(self):
+        while self.Index and self.disk_size > self.Size:
+            path = min(self.Index, key=lambda k: self.Index[k]['time'])
+            key = self.Index.pop(path)['key']
+            if key not in [d['key'] for d in self.Index.values()] and self.file(key).exists():
+                self.Bytes -= self.file(key).stat().st_size
+                remove_file(self.file(key), warn=False)
+
+    def save(self):
+        if self.ReadOnly:
+            return
+        self.IndexFile.write_text(dumps(self.Index, indent=1))
+        self.Modified = False
+
+    def flush(self):
+        self.save() if self.Modified and self.Dir.exists() else do_nothing()
+
+    def clear(self):
+        for key in {d['key'] for d in self.Index.values()}:
+            remove_file(self.file(key), warn=False)
+        self.Index, self.Bytes = {}, 0
+        self.save() if self.Dir.exists() else do_nothing()
 
 
 class SaveDraw(Draw):
 
     Save = True
     SaveOnServer = True
+    MaxWaste = .5  # the plot file is compacted if more than this fraction of it is taken by overwritten plots
+    Pool = None  # process pool to render the canvases in the background
+    Jobs = []
+    MaxJobs = 100  # the finished jobs are collected if there are more
+    Deferred = None  # server and cache writes of a worker process, which are done by the parent process
 
     ServerMountDir: Path = None
-    Dummy = TFile(str(Draw.Dir.joinpath('dummy.root')), 'RECREATE')
+    Dummy = None  # scratch ROOT directory, created on first use
 
     def __init__(self, analysis=None, results_dir='', sub_dir=''):
         self.Analysis = analysis
         super(SaveDraw, self).__init__(self.find_config())
 
         self.File = None
+        self.Batch = False
+        self.ServerDir = None
 
         # INFO
         SaveDraw.Save = Draw.Config.get_value('SAVE', 'save', default=False)
@@ -31,12 +171,26 @@ class SaveDraw(Draw):
         # Results
         self.ResultsDir = BaseDir.joinpath('results', results_dir)
         self.SubDir = str(sub_dir)
+        self.Cache = PlotCache(self.ResultsDir, Draw.Config.get_value('SAVE', 'plot cache size', default=500)) if Draw.Config.get_value('SAVE', 'plot cache', default=False) else None
 
         # Server
         SaveDraw.ServerMountDir = Path(Draw.Config.get_value('SAVE', 'server mount directory', default=None)).expanduser()
 
+        # Background saving
+        SaveDraw.start_pool(Draw.Config.get_value('SAVE', 'workers', default=0)) if SaveDraw.Pool is None else do_nothing()
+
     def __del__(self):
-        remove_file(join(self.Dir, 'dummy.root'), warn=False)
+        remove_file(SaveDraw.dummy_file(), warn=False)
+
+    @staticmethod
+    def dummy_file():
+        return Draw.Dir.joinpath(f'{Draw.Prefix}dummy.root')  # the prefix is unique for each worker process
+
+    @staticmethod
+    def dummy():
+        if SaveDraw.Dummy is None:
+            SaveDraw.Dummy = TFile(str(SaveDraw.dummy_file()), 'RECREATE')
+        return SaveDraw.Dummy
 
     # ----------------------------------------
     # region INIT
@@ -55,6 +209,8 @@ class SaveDraw(Draw):
 
     @property
     def server_dir(self):
+        if self.ServerDir is not None:
+            return self.ServerDir
         if self.Analysis is not None:
             return SaveDraw.ServerMountDir.joinpath('content', self.Analysis.server_save_dir)
 
@@ -71,33 +227,54 @@ class SaveDraw(Draw):
     # ----------------------------------------
     # region SET
     def open_file(self, *exclude, prnt=False):
-        if self.File is None or exclude:
-            pal = Draw.Palette
+        """ opens the plot file for incremental updates and removes the plots [exclude] """
+        if self.File is None:
             info('opening ROOT file on server ...', prnt=prnt)
-            data = {}
-            if self.file_name.exists():
-                if self.file_name.stat().st_size < 1000:   # file must be corrupted or empty
-                    self.rm_plots()
-                f0 = TFile(str(self.file_name), 'UPDATE')
-                data = {key.GetName(): f0.Get(key.GetName()) for key in f0.GetListOfKeys()}
-            f = TFile(str(self.file_name), 'RECREATE')
-            set_palette(pal)
-            for key, c in data.items():
-                if c and key not in exclude:
-                    c.Write(key)
-            f.Write()
-            self.File = f
+            if self.file_name.exists() and self.file_name.stat().st_size < 1000:  # file must be corrupted or empty
+                self.rm_plots()
+            self.File = TFile(str(self.file_name), 'UPDATE')
+        for key in exclude:
+            self.File.Delete(f'{key};*')
 
     def close_file(self):
         if self.File is not None:
+            waste = 1 - sum(key.GetNbytes() for key in self.File.GetListOfKeys()) / max(self.File.GetEND(), 1)
             self.File.Close()
             self.File = None
+            self.compact() if waste > SaveDraw.MaxWaste else do_nothing()
+
+    def compact(self):
+        """ rewrites the plot file to free the space of the overwritten and deleted plots """
+        pal, tmp = Draw.Palette, self.file_name.with_suffix('.tmp')
+        f0 = TFile(str(self.file_name))
+        data = {key.GetName(): f0.Get(key.GetName()) for key in f0.GetListOfKeys()}
+        f = TFile(str(tmp), 'RECREATE')
+        set_palette(pal)
+        for key, c in data.items():
+            c.Write(key) if c else do_nothing()
+        f.Close()
+        f0.Close()
+        tmp.replace(self.file_name)
+        SaveDraw.dummy().cd()
+
+    @contextmanager
+    def batch(self):
+        """ keeps the plot file open for all plots saved within the context and creates the overview only once at the end """
+        self.Batch = True
+        try:
+            yield self
+        finally:
+            self.Batch = False
+            if self.File is not None:
+                self.close_file()
+                self.create_overview(redo=False)
 
     def rm_plots(self):
         remove_file(self.file_name)
 
     def remove_plots(self, *exclude):
         self.open_file(*exclude, prnt=False)
+        self.close_file() if not self.Batch else do_nothing()
 
     def create_overview(self, x=4, y=3, redo=True):
         if self.server_dir is not None:
@@ -120,13 +297,31 @@ class SaveDraw(Draw):
         self.save_plots(None, full_path=join(self.Dir, filename), show=False, cname=cname, **kwargs)
 
     def histo(self, histo, file_name=None, show=True, prnt=True, save=True, info_leg=True, all_pads=False, fn=None, *args, **kwargs):
+        file_name = choose(fn, file_name)
+        cached = self.Cache is not None and save and SaveDraw.Save and file_name is not None
+        path, key = (self.file_path(file_name), PlotCache.key(histo, Draw.Title, info_leg, all_pads, args, sorted(kwargs.items()))) if cached else (None, None)
+        c = self.Cache.get(path, key) if cached else None
+        if c is not None:
+            info(f'plot unchanged: {path.name}', prnt=prnt and self.Verbose)
+            return Draw.add(c)
         c = super(SaveDraw, self).histo(histo, show, info_leg=False, *args, **kwargs)
         if info_leg:
             self.Info.draw(c, all_pads)
         histo.SetTitle('') if not Draw.Title else do_nothing()
-        self.save_plots(choose(fn, file_name), prnt=prnt, show=show, save=save)
+        self.save_plots(file_name, prnt=prnt, show=show, save=save)
+        if cached:
+            files = [str(path.with_name(f'{path.name}.{f}')) for f in self.file_types()]
+            self.Cache.add(path, key, c, files) if SaveDraw.Deferred is None else SaveDraw.Deferred.append(('cache', str(self.ResultsDir), self.Cache.Size / 2 ** 20, str(path), key, pdumps(c), files))
         return c
 
+    @staticmethod
+    def file_types(ftype=None):
+        """ :returns: extensions of the files which are written for each plot """
+        return [f.strip('.') for f in choose(make_list(ftype), default=Draw.FileTypes, decider=ftype)]
+
+    def file_path(self, file_name, res_dir=None, sub_dir=None):
+        return Path(choose(res_dir, self.ResultsDir), choose(sub_dir, self.SubDir), file_name)
+
     def save_plots(self, savename, sub_dir=None, canvas=None, full_path=None, prnt=True, ftype=None, show=True, save=True, cname=None, **kwargs):
         """ Saves the canvas at the desired location. If no canvas is passed as argument, the active canvas will be saved. However, for applications without graphical interface,
          such as in SSl terminals, it is recommended to pass the canvas to the method. """
@@ -139,6 +334,7 @@ class SaveDraw(Draw):
         update_canvas(canvas)
         try:
             self.__save_canvas(canvas, sub_dir=sub_dir, file_name=savename, ftype=ftype, full_path=full_path, **kwargs)
+            Draw.release_canvas(canvas)
             return Draw.add(canvas)
         except Exception as inst:
             warning('Error saving plots ...:\n  {}'.format(inst))
@@ -146,14 +342,17 @@ class SaveDraw(Draw):
     def __save_canvas(self, canvas, file_name, res_dir=None, sub_dir=None, full_path=None, ftype=None, prnt=True, show=True, **kwargs):
         """should not be used in analysis methods..."""
         _ = kwargs
-        file_path = Path(join(choose(res_dir, self.ResultsDir), choose(sub_dir, self.SubDir), file_name) if full_path is None else full_path)
+        file_path = self.file_path(file_name, res_dir, sub_dir) if full_path is None else Path(full_path)
         ensure_dir(file_path.parent)
         info(f'saving plot: {file_path.name}', prnt=prnt and self.Verbose)
         canvas.Update()
-        Draw.set_show(show)  # needs to be in the same batch so that the pictures are created, takes forever...
-        set_root_warnings(False)
-        for f in choose(make_list(ftype), default=['pdf'], decider=ftype):
-            canvas.SaveAs(f'{file_path}.{f.strip(".")}')
+        ftypes = self.file_types(ftype)
+        if SaveDraw.Pool is not None:
+            SaveDraw.Jobs.append((file_path.name, SaveDraw.Pool.submit(run_task, render, pdumps(canvas), str(file_path), ftypes)))
+            SaveDraw.flush(block=False) if len(SaveDraw.Jobs) > SaveDraw.MaxJobs else do_nothing()
+        else:
+            Draw.set_show(show)  # needs to be in the same batch so that the pictures are created, takes forever...
+            render(canvas, file_path, ftypes)
         self.save_on_server(canvas, file_path.name, save=full_path is None, prnt=prnt)
         Draw.set_show(True)
 
@@ -161,20 +360,71 @@ class SaveDraw(Draw):
         prnt = force_print or prnt and Draw.Verbose and not Draw.Show
         info(join('https://diamond.ethz.ch', self.ServerMountDir.name, Path(self.server_dir, file_name).relative_to(self.ServerMountDir)), prnt=prnt)
 
+    @Prof.timed('server')
     def save_on_server(self, canvas, file_name, save=True, prnt=True):
         d = self.server_dir
         if d is not None and save and SaveDraw.SaveOnServer and self.mount_exists:
+            if SaveDraw.Deferred is not None:
+                return SaveDraw.Deferred.append(('server', str(d), file_name, pdumps(canvas)))
             d.mkdir(parents=True, exist_ok=True)
             p = d.joinpath(f'{Path(file_name).stem}.html')
-            self.open_file(file_name)
+            self.open_file()
             html.create_root(p, title=p.parent.name, pal=55 if is_iter(Draw.Palette) else Draw.Palette, verbose=self.Verbose)
             self.File.cd()
-            canvas.Write(file_name)
-            self.File.Write()
-            SaveDraw.Dummy.cd()
+            canvas.Write(file_name, TObject.kOverwrite)
+            SaveDraw.dummy().cd()
             self.print_http(p.name, prnt)
-            self.create_overview(redo=False)
-            self.close_file()
+            if not self.Batch:
+                self.close_file()
+                self.create_overview(redo=False)
+
+    @staticmethod
+    def save_deferred(records):
+        """ performs the server and cache writes [records] of the worker processes, so that only this process writes to the plot files and indices """
+        records, caches = list(records), {}
+        for d in dict.fromkeys(r[1] for r in records if r[0] == 'server'):
+            s = SaveDraw()
+            s.ServerDir = Path(d)
+            with s.batch():
+                for _, _, file_name, c in [r for r in records if r[0] == 'server' and r[1] == d]:
+                    s.save_on_server(ploads(c), file_name, prnt=False)
+        for _, res_dir, size, path, key, c, files in [r for r in records if r[0] == 'cache']:
+            if res_dir not in caches:
+                caches[res_dir] = PlotCache(res_dir, size)
+            caches[res_dir].add(Path(path), key, ploads(c), files)
+
+    @staticmethod
+    def start_pool(workers):
+        """ renders the saved canvases in [workers] background processes. Worker processes (with deferred writes) never start their own pool. """
+        SaveDraw.flush()
+        SaveDraw.Pool.shutdown() if SaveDraw.Pool is not None else do_nothing()
+        start = workers > 0 and SaveDraw.Deferred is None
+        SaveDraw.Pool = ProcessPoolExecutor(workers, get_context('spawn'), init_render, (str(Draw.Config.FilePath), Draw.Palette, Prof.Active)) if start else None
+
+    @staticmethod
+    def flush(prnt=True, block=True):
+        """ waits until all canvases in the background are saved, only collects the finished ones if not [block].
+            :returns: dictionary of the plots which could not be saved and the errors """
+        wait([f for _, f in SaveDraw.Jobs]) if block else do_nothing()
+        done = [(name, f) for name, f in SaveDraw.Jobs if f.done()]
+        errors = {name: f.exception() for name, f in done if f.exception() is not None}
+        Prof.merge(*[f.result()[2] for _, f in done if f.exception() is None])
+        for name, e in errors.items():
+            warning(f'Error saving plot {name} ...:\n  {e}', prnt=prnt)
+        SaveDraw.Jobs = [(name, f) for name, f in SaveDraw.Jobs if not f.done()]
+        return errors
+
+    @staticmethod
+    @contextmanager
+    def background(workers=4):
+        """ saves the canvases within the context in the background and waits for them at the end """
+        pool = SaveDraw.Pool
+        SaveDraw.start_pool(workers) if pool is None else do_nothing()
+        try:
+            yield SaveDraw
+        finally:
+            SaveDraw.flush()
+            SaveDraw.start_pool(0) if pool is None else do_nothing()
 
     @staticmethod
     def save_last(canvas=None, ext='pdf', prnt=None):
@@ -191,5 +441,106 @@ class SaveDraw(Draw):
     # ----------------------------------------
 
 
+register(SaveDraw.flush)  # report the errors of the plots which are still rendered at exit
+
+
+def init_task(config, pal, profile=False):
+    """ sets up a worker process, which leaves the writes of the shared files to the parent process and never starts its own render pool """
+    SaveDraw.Deferred, PlotCache.ReadOnly = [], True
+    Draw.init_worker(config, pal=pal, profile=profile)
+
+
+def init_render(config, pal, profile=False):
+    """ sets up the style for rendering in a background process """
+    init_task(config, pal, profile)
+    set_root_output(False)
+
+
+def render(canvas, file_path, ftypes):
+    canvas = ploads(canvas) if type(canvas) is bytes else canvas
+    set_root_warnings(False)
+    for f in ftypes:
+        with Prof.stage(f'save {f}'):
+            canvas.SaveAs(f'{file_path}.{f}')
+
+
+# ----------------------------------------
+# region EXPORT
+def load_manifest(manifest):
+    """ :returns: list of the plots of the [manifest], which is a list or a json file with entries {'call': function or 'module:function', 'args': [...], 'kwargs': {...}} """
+    return load_json(manifest) if isinstance(manifest, (str, Path)) else list(manifest)
+
+
+def find_function(call):
+    if callable(call):
+        return call
+    module, name = call.split(':')
+    f = import_module(module)
+    for attr in name.split('.'):
+        f = getattr(f, attr)
+    return f
+
+
+def run_task(f, *args):
+    """ calls [f] in a worker process. :returns: its result, the server and cache writes and the timings, which are left to the parent process """
+    SaveDraw.Deferred, PlotCache.ReadOnly = [], True
+    Prof.reset()
+    res = f(*args)
+    SaveDraw.flush()  # in case a pool was started before the process was marked as worker
+    return res, SaveDraw.Deferred, Prof.Data
+
+
+def init_export(config, pal, ftypes, profile=False):
+    init_task(config, pal, profile)
+    Draw.set_export(True, ftypes)
+
+
+def export_plot(plot):
+    """ calls the function of the [plot] from the manifest, which draws and saves it. :returns: error message, None on success """
+    try:
+        find_function(plot['call'])(*plot.get('args', []), **plot.get('kwargs', {}))
+    except Exception as err:
+        return f'{plot["call"]}: {err!r}'
+
+
+def export(manifest, workers=None, ftypes=None):
+    """ renders all plots of the [manifest] in export mode, fanned out to [workers] processes (default from the config).
+        The workers only render, the plots on the server and the cache index are written afterwards by this process.
+        :returns: list of the errors of the plots which failed """
+    plots, workers = load_manifest(manifest), choose(workers, Draw.Workers)
+    Draw() if Draw.Config is None else do_nothing()
+    if workers > 1:
+        with ProcessPoolExecutor(workers, get_context('spawn'), init_export, (str(Draw.Config.FilePath), Draw.Palette, ftypes, Prof.Active)) as pool:
+            errors, records, timings = zip(*pool.map(partial(run_task, export_plot), plots, chunksize=max(1, len(plots) // (4 * workers)))) if plots else ([], [], [])
+        SaveDraw.save_deferred(chain(*records))
+        Prof.merge(*timings)
+    else:
+        status, types = Draw.Export, Draw.FileTypes
+        Draw.set_export(True, ftypes)
+        errors = [export_plot(plot) for plot in plots]
+        Draw.set_export(status, types)
+    errors = [e for e in errors if e is not None]
+    for e in errors:
+        warning(f'Error exporting plot ...:\n  {e}')
+    return errors
+
+
+def map_plots(f, items, workers=None):
+    """ calls the plotting function [f] for all [items] in [workers] processes (default from the config), each with its own drawing state.
+        [f] has to be importable (defined at module level) and save its plots itself, e.g. with SaveDraw. The workers leave the server and cache writes to this process.
+        :returns: list of the results """
+    Draw() if Draw.Config is None else do_nothing()
+    workers, items = choose(workers, Draw.Workers), list(items)
+    if workers < 2:
+        return [f(item) for item in items]
+    with ProcessPoolExecutor(workers, get_context('spawn'), init_task, (str(Draw.Config.FilePath), Draw.Palette, Prof.Active)) as pool:
+        res, records, timings = zip(*pool.map(partial(run_task, f), items)) if items else ([], [], [])
+    SaveDraw.save_deferred(chain(*records))
+    Prof.merge(*timings)
+    return list(res)
+# endregion EXPORT
+# ----------------------------------------
+
+
 if __name__ == '__main__':
     z = SaveDraw()
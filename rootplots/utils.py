@@ -3,16 +3,19 @@
 # created on October 27th 2021 by M. Reichmann
 # --------------------------------------------------------
 from configparser import ConfigParser, NoOptionError, NoSectionError
-from copy import deepcopy
+from contextlib import nullcontext, contextmanager
+from copy import copy, deepcopy
 from datetime import datetime
-from json import loads, load
+from functools import wraps
+from json import loads, load, dumps
 from os import _exit, makedirs, remove
 from os.path import exists, isfile, join, sep
-from time import time
+from time import time, perf_counter
 from pathlib import Path
 from subprocess import check_call, check_output
 
-from numpy import array, zeros, count_nonzero, sqrt, average, full, all, arctan2, cos, sin, corrcoef, mean
+import numpy as np
+from numpy import array, zeros, count_nonzero, sqrt, average, full, all, arctan2, cos, sin, corrcoef, mean, asarray, hypot, concatenate, ndim, where, errstate
 from uncertainties import ufloat_fromstr, ufloat
 from uncertainties.core import Variable, AffineScalarFunc
 from inspect import getframeinfo, stack
@@ -54,10 +57,77 @@ def info(txt, blank_lines=0, endl=True, prnt=True):
     return time()
 
 
-def add_to_info(t, msg='Done', color=None, prnt=True):
+def add_to_info(t, msg='Done', color=None, prnt=True, stage=None):
+    Prof.add(stage, time() - t) if stage is not None and Prof.Active else do_nothing()
     print(colored(f'{msg} ({time() - t:2.2f} s)', color)) if prnt else do_nothing()
 
 
+class Profiler(object):
+    """ collects the number of calls and the time spent in the stages of the drawing pipeline. If inactive, the timers only check a flag. """
+
+    NoTimer = nullcontext()
+
+    def __init__(self, active=False):
+        self.Active = active
+        self.Data = {}  # stage -> [calls, time]
+
+    def __repr__(self):
+        return f'{self.__class__.__name__} ({"ON" if self.Active else "OFF"}): {len(self.Data)} stages, {sum(t for _, t in self.Data.values()):.2f} s'
+
+    def add(self, stage, t=0., n=1):
+        d = self.Data.setdefault(stage, [0, 0.])
+        d[0] += n
+        d[1] += t
+
+    def merge(self, *data):
+        """ adds the timings [data] collected in other processes """
+        for d in data:
+            for stage, (n, t) in d.items():
+                self.add(stage, t, n)
+
+    def stage(self, name):
+        """ :returns: context manager timing the code inside as stage [name] """
+        return self.timer(name) if self.Active else Profiler.NoTimer
+
+    @contextmanager
+    def timer(self, name):
+        t = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, perf_counter() - t)
+
+    def timed(self, stage):
+        """ decorator timing every call of the function as [stage] """
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if not self.Active:
+                    return f(*args, **kwargs)
+                with self.timer(stage):
+                    return f(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def report(self):
+        """ :returns: calls, total and mean time of each stage, sorted by the total time """
+        return {s: {'calls': n, 'time': t, 'mean': t / n if n else 0.} for s, (n, t) in sorted(self.Data.items(), key=lambda i: -i[1][1])}
+
+    def show(self):
+        print(f'{"stage":<20} {"calls":>8} {"time [s]":>10} {"mean [ms]":>10}')
+        for s, d in self.report().items():
+            print(f'{s:<20} {d["calls"]:>8} {d["time"]:>10.3f} {1000 * d["mean"]:>10.3f}')
+
+    def save(self, file_name):
+        Path(file_name).write_text(dumps(self.report(), indent=2))
+
+    def reset(self):
+        self.Data = {}
+
+
+Prof = Profiler()
+
+
 def warning(txt, blank_lines=0, prnt=True):
     prnt_msg(txt, 'WARNING', YELLOW, blank_lines, prnt=prnt)
 
@@ -108,15 +178,15 @@ def is_ufloat(value):
 
 
 def uarr2n(x):
-    return array([i.n for i in x]) if len(x) and is_ufloat(x[0]) else x
+    return x.n if isinstance(x, UArray) else array([i.n for i in x]) if len(x) and is_ufloat(x[0]) else x
 
 
 def uarr2s(arr):
-    return array([i.s for i in arr]) if len(arr) and is_ufloat(arr[0]) else arr
+    return arr.s if isinstance(arr, UArray) else array([i.s for i in arr]) if len(arr) and is_ufloat(arr[0]) else arr
 
 
 def arr2u(x, ex):
-    return array([ufloat(i, e) for i, e in zip(x, ex)])
+    return UArray(x, ex)
 
 
 def add_err(u, e):
@@ -128,11 +198,12 @@ def add_perr(u, e):
 
 
 def eff2u(eff):
-    return ufloat(eff[0], mean(eff[1:])) if eff.shape == (3,) else array([eff2u(e) for e in eff])
+    eff = asarray(eff)
+    return ufloat(eff[0], mean(eff[1:])) if eff.shape == (3,) else UArray(eff[:, 0], mean(eff[:, 1:], axis=1))
 
 
 def make_ufloat(n, s=0):
-    return (eff2u(n) if len(n) == 3 and s == 0 else array([ufloat(*v) for v in array([n, s]).T])) if is_iter(n) else n if is_ufloat(n) else ufloat(n, s)
+    return (eff2u(n) if len(n) == 3 and s == 0 else UArray(n, s)) if is_iter(n) else n if is_ufloat(n) else ufloat(n, s)
 
 
 def make_list(value):
@@ -169,7 +240,8 @@ def mean_sigma(values, weights=None, err=True):
     use_variance = is_ufloat(values[0])
     if use_variance:
         errors = uarr2s(values)
-        weights = full(errors.size, 1) if all(errors == errors[0]) else [1 / e ** 2 if e else 0 for e in errors]
+        with errstate(divide='ignore'):
+            weights = full(errors.size, 1) if all(errors == errors[0]) else where(errors != 0, 1 / errors ** 2, 0)
         values = uarr2n(values)
     if all(weights == 0):
         return [0, 0]
@@ -255,16 +327,25 @@ def load_json(filename):
 
 class Config(ConfigParser):
 
-    def __init__(self, file_name, section=None, from_json=False, required=False, **kwargs):
+    Missing = object()
+
+    def __init__(self, file_name, section=None, from_json=False, required=False, watch=False, **kwargs):
         super(Config, self).__init__(**kwargs)
         self.FilePath = Path(file_name)
+        self.FromJson = from_json
+        self.Cache = {}  # parsed values by (section, option, type), cleared by all methods changing the data
+        self.Watch = watch  # reload the file if it was modified
         if required and not self.FilePath.exists():
             critical(f'{self!r} does not exist!')
         self.read_dict(load_json(file_name)) if from_json else self.read(file_name) if type(file_name) is not list else self.read_file(file_name)
+        self.MTime = self.mtime
         self.Section = self.check_section(section)
 
     def __call__(self, section):
-        return Config(self.FilePath, section)
+        """ :returns: view of the config with the default [section], sharing the data and cache without reading the file again """
+        c = copy(self)
+        c.Section = c.check_section(section)
+        return c
 
     def __repr__(self):
         return f'{self.__class__.__name__}: {join(*self.FilePath.parts[-2:])}' + (f' (section = {self.Section})' if hasattr(self, 'Section') and self.Section else '')
@@ -278,16 +359,62 @@ class Config(ConfigParser):
     def set_section(self, sec):
         self.Section = self.check_section(sec)
 
+    @property
+    def mtime(self):
+        return self.FilePath.stat().st_mtime if self.FilePath.is_file() else None
+
+    def reload(self):
+        """ reads the data again from the original source """
+        for sec in self.sections():
+            self.remove_section(sec)
+        self.read_dict(load_json(self.FilePath)) if self.FromJson else self.read(self.FilePath)
+        self.MTime = self.mtime
+
+    def clear_cache(self):
+        self.Cache.clear() if hasattr(self, 'Cache') else do_nothing()  # ConfigParser.__init__ may already set values
+
+    def set(self, section, option, value=None):
+        self.clear_cache()
+        super(Config, self).set(section, option, value)
+
+    def remove_option(self, section, option):
+        self.clear_cache()
+        return super(Config, self).remove_option(section, option)
+
+    def remove_section(self, section):
+        self.clear_cache()
+        return super(Config, self).remove_section(section)
+
+    def read(self, filenames, encoding=None):
+        self.clear_cache()
+        return super(Config, self).read(filenames, encoding)
+
+    def read_file(self, f, source=None):
+        self.clear_cache()
+        super(Config, self).read_file(f, source)
+
+    def read_dict(self, dictionary, source='<dict>'):
+        self.clear_cache()
+        super(Config, self).read_dict(dictionary, source)
+
     def get_value(self, section, option=None, dtype: type = str, default=None):
         dtype = type(default) if default is not None else dtype
         s, o = (self.Section, section) if option is None else (section, option)
+        self.reload() if self.Watch and self.mtime != self.MTime else do_nothing()
+        key = (s, o, dtype)
+        if key not in self.Cache:
+            self.Cache[key] = self.parse(s, o, dtype)
+        v = self.Cache[key]
+        return default if v is Config.Missing else copy(v) if type(v) in [list, dict] else v
+
+    def parse(self, section, option, dtype):
         try:
             if dtype is bool:
-                return self.getboolean(s, o)
-            v = self.get(s, o)
+                return self.getboolean(section, option)
+            v = self.get(section, option)
             return loads(v.replace('\'', '\"')) if '[' in v or '{' in v and dtype is not str else dtype(v)
         except (NoOptionError, NoSectionError, ValueError):
-            return default
+            return Config.Missing
 
     def get_values(self, section=None):
         return [*self[choose(section, self.Section)].values()]
@@ -425,6 +552,278 @@ def add_asym_error(v, s0=0, s1=0):
     return array([add_asym_error(i, s0, s1) for i in v], dtype=AsymVar) if is_iter(v) else AsymVar(0, s0, s1) + v
 
 
+class UArray(object):
+    """ Array of values with uncertainties stored as two float arrays (nominal values and errors), optionally with asymmetric lower and upper errors.
+        The uncertainties are propagated vectorised assuming uncorrelated errors between different operands (x - y), only identical operands (x - x, x / x) are treated as fully correlated.
+        Single elements are returned as ufloat, conversion to arrays of ufloat only happens with to_ufloat. """
+
+    Operators = {np.add: 'add', np.subtract: 'sub', np.multiply: 'mul', np.true_divide: 'truediv', np.power: 'pow'}
+    Unary = {np.negative: '__neg__', np.positive: '__pos__', np.absolute: '__abs__'}
+    Nominal = [np.equal, np.not_equal, np.less, np.less_equal, np.greater, np.greater_equal, np.isfinite, np.isnan, np.isinf, np.sign]  # only depend on the values
+
+    def __init__(self, n, s=None, s0=None, s1=None):
+        self.N = asarray(n, dtype='d')
+        self.Asym = s0 is not None or s1 is not None
+        self.S0, self.S1 = [self.err(e) for e in [s0, s1]] if self.Asym else [self.err(s)] * 2
+
+    def err(self, e):
+        return zeros(self.N.shape) if e is None else asarray(e, dtype='d') + zeros(self.N.shape)
+
+    @classmethod
+    def make(cls, n, s0, s1, asym=False):
+        return cls(n, s0=s0, s1=s1) if asym else cls(n, s0)
+
+    @classmethod
+    def from_ufloat(cls, x):
+        if isinstance(x, UArray):
+            return x
+        x = list(x)
+        if not len(x) or not is_ufloat(x[0]):
+            return cls(x)
+        if type(x[0]) is AsymVar:
+            n, s0, s1 = array([[i.n, i.s0, i.s1] for i in x]).T
+            return cls(n, s0=s0, s1=s1)
+        return cls(*array([[i.n, i.s] for i in x]).T)
+
+    @staticmethod
+    def concatenate(arrays):
+        a = [UArray.from_ufloat(i) for i in arrays]
+        return UArray.make(*[concatenate([getattr(i, att) for i in a]) for att in ['N', 'S0', 'S1']], any(i.Asym for i in a))
+
+    def __len__(self):
+        return len(self.N)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.format()})'
+
+    def __str__(self):
+        return self.format()
+
+    def format(self, fmt='.2f'):
+        return f'[{", ".join(self[i].format(fmt) if self.ndim > 1 else f"{self[i]:{fmt}}" for i in range(len(self)))}]'
+
+    def __array__(self, dtype=None, copy=None):
+        return self.to_ufloat() if dtype is None or dtype is object else self.N.astype(dtype)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        """ evaluates the arithmetic with error propagation and the comparisons on the nominal values, all other ufuncs fall back to arrays of ufloat """
+        if method == '__call__' and not kwargs:
+            if ufunc in UArray.Operators:
+                a, b = inputs
+                return getattr(a, f'__{UArray.Operators[ufunc]}__')(b) if isinstance(a, UArray) else getattr(b, f'__r{UArray.Operators[ufunc]}__')(a)
+            if ufunc in UArray.Unary:
+                return getattr(inputs[0], UArray.Unary[ufunc])()
+            if ufunc in UArray.Nominal:
+                return ufunc(*[UArray.parts(i)[0] for i in inputs])
+        return getattr(ufunc, method)(*[i.to_ufloat() if isinstance(i, UArray) else i for i in inputs], **kwargs)
+
+    def __getitem__(self, item):
+        n = self.N[item]
+        if not ndim(n):
+            return AsymVar(n, self.S0[item], self.S1[item]) if self.Asym else ufloat(n, self.S0[item])
+        return UArray.make(n, self.S0[item], self.S1[item], self.Asym)
+
+    def __setitem__(self, item, value):
+        n, s0, s1, asym = self.parts(value)
+        if asym and not self.Asym:
+            self.Asym, self.S1 = True, self.S0.copy()
+        self.N[item], self.S0[item] = n, s0
+        if self.Asym:
+            self.S1[item] = s1
+
+    # ----------------------------------------
+    # region ARITHMETIC
+    @staticmethod
+    def parts(o):
+        """ :returns: nominal value, lower error, upper error and asymmetry of [o] (errors are None for exact numbers) """
+        if isinstance(o, UArray):
+            return o.N, o.S0, o.S1, o.Asym
+        if type(o) is AsymVar:
+            return o.n, o.s0, o.s1, True
+        if is_ufloat(o):
+            return o.n, o.s, o.s, False
+        if is_iter(o) and len(o) and is_ufloat(next(iter(o))):
+            return UArray.parts(UArray.from_ufloat(o))
+        return asarray(o, dtype='d'), None, None, False
+
+    def __neg__(self):
+        return UArray.make(-self.N, self.S1, self.S0, self.Asym)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        neg = self.N < 0
+        return UArray.make(abs(self.N), where(neg, self.S1, self.S0), where(neg, self.S0, self.S1), self.Asym)
+
+    def __add__(self, other):
+        if other is self:
+            return self * 2
+        n, s0, s1, asym = self.parts(other)
+        if s0 is None:
+            return UArray.make(self.N + n, self.S0, self.S1, self.Asym)
+        return UArray.make(self.N + n, hypot(self.S0, s0), hypot(self.S1, s1), self.Asym or asym)
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if other is self:
+            return UArray(zeros(self.shape))
+        n, s0, s1, asym = self.parts(other)
+        return self + (-n if s0 is None else -UArray.make(n, s0, s1, asym))
+
+    def __rsub__(self, other):
+        return -self + other
+
+    def __mul__(self, other):
+        if other is self:
+            return self ** 2
+        n, s0, s1, asym = self.parts(other)
+        if s0 is None:
+            neg = n < 0
+            return UArray.make(self.N * n, abs(n) * where(neg, self.S1, self.S0), abs(n) * where(neg, self.S0, self.S1), self.Asym)
+        return UArray(self.N * n, hypot(n * self.s, self.N * (s0 + s1) / 2))
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        if other is self:
+            return UArray(self.N / self.N)
+        n, s0, s1, asym = self.parts(other)
+        if s0 is None:
+            return self * (1 / n)
+        return UArray(self.N / n, hypot(self.s / n, self.N * (s0 + s1) / 2 / n ** 2))
+
+    def __rtruediv__(self, other):
+        n, s0, s1, asym = self.parts(other)
+        return UArray(n / self.N, hypot(0 if s0 is None else (s0 + s1) / 2 / self.N, n * self.s / self.N ** 2))
+
+    def __pow__(self, p):
+        return UArray(self.N ** p, abs(p * self.N ** (p - 1)) * self.s)
+
+    def __eq__(self, other):
+        return self.N == self.parts(other)[0]
+
+    def __ne__(self, other):
+        return self.N != self.parts(other)[0]
+
+    def __lt__(self, other):
+        return self.N < self.parts(other)[0]
+
+    def __le__(self, other):
+        return self.N <= self.parts(other)[0]
+
+    def __gt__(self, other):
+        return self.N > self.parts(other)[0]
+
+    def __ge__(self, other):
+        return self.N >= self.parts(other)[0]
+
+    def sum(self, axis=None, **kwargs):
+        _ = kwargs
+        s = UArray(self.N.sum(axis), sqrt((self.s ** 2).sum(axis)))
+        return s if s.ndim else ufloat(s.n, s.s)
+
+    def mean(self, axis=None, **kwargs):
+        return self.sum(axis, **kwargs) / (self.size if axis is None else self.shape[axis])
+
+    def argmax(self, axis=None, **kwargs):
+        _ = kwargs
+        return self.N.argmax(axis)
+
+    def argmin(self, axis=None, **kwargs):
+        _ = kwargs
+        return self.N.argmin(axis)
+
+    def max(self, axis=None, **kwargs):
+        return self.take(self.argmax(axis, **kwargs), axis)
+
+    def min(self, axis=None, **kwargs):
+        return self.take(self.argmin(axis, **kwargs), axis)
+
+    def take(self, i, axis=None):
+        """ :returns: the elements with the flat indices [i] or the indices [i] along [axis] """
+        if axis is None:
+            return self[np.unravel_index(i, self.shape)]
+        i = np.expand_dims(i, axis)
+        return UArray.make(*[np.take_along_axis(a, i, axis).squeeze(axis) for a in [self.N, self.S0, self.S1]], self.Asym)
+    # endregion ARITHMETIC
+    # ----------------------------------------
+
+    # ----------------------------------------
+    # region SHAPE
+    @property
+    def shape(self):
+        return self.N.shape
+
+    @property
+    def size(self):
+        return self.N.size
+
+    @property
+    def ndim(self):
+        return self.N.ndim
+
+    def reshape(self, *shape):
+        return UArray.make(*[a.reshape(*shape) for a in [self.N, self.S0, self.S1]], self.Asym)
+
+    def flatten(self):
+        return UArray.make(*[a.flatten() for a in [self.N, self.S0, self.S1]], self.Asym)
+
+    @property
+    def T(self):  # noqa
+        return UArray.make(self.N.T, self.S0.T, self.S1.T, self.Asym)
+
+    def copy(self):
+        return UArray.make(self.N.copy(), self.S0.copy(), self.S1.copy(), self.Asym)
+    # endregion SHAPE
+    # ----------------------------------------
+
+    # ----------------------------------------
+    # region CONVERSION
+    def to_ufloat(self):
+        u = array([ufloat(n, s) for n, s in zip(self.N.flat, self.s.flat)] if self.size else [], dtype=object)
+        return u.reshape(self.shape)
+
+    def to_asym(self):
+        return array([AsymVar(n, s0, s1) for n, s0, s1 in zip(self.N.flat, self.S0.flat, self.S1.flat)], dtype=object).reshape(self.shape)
+
+    def to_array(self):
+        """ :returns: array with the columns [value, error] or [value, lower error, upper error] """
+        return array([self.N, self.S0, self.S1] if self.Asym else [self.N, self.S0]).T
+
+    @property
+    def nominal_values(self):
+        return self.N
+    n = nominal_values
+
+    @property
+    def std_devs(self):
+        return (self.S0 + self.S1) / 2 if self.Asym else self.S0
+    s = std_devs
+
+    @property
+    def lower_errors(self):
+        return self.S0
+    s0 = lower_errors
+
+    @property
+    def upper_errors(self):
+        return self.S1
+    s1 = upper_errors
+    # endregion CONVERSION
+    # ----------------------------------------
+
+
+def uarray(n, s=None, s0=None, s1=None):
+    return UArray(n, s, s0, s1)
+
+
+def uconcatenate(arrays):
+    return UArray.concatenate(arrays) if any(isinstance(a, UArray) for a in arrays) else concatenate(arrays)
+
+
 def download_file(server, loc, target, out=True):
     cmd = f'rsync -aPvL {server}:{loc} {target}'
     return (check_call if out else check_output)(cmd, shell=True)
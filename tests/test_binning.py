@@ -0,0 +1,82 @@
+import numpy as np
+
+from rootplots import binning as bins
+
+
+def test_quantiles():
+    x = np.random.default_rng(1).normal(size=10 ** 5)
+    assert np.allclose(bins.quantiles(x, [.1, .5, .9]), np.quantile(x, [.1, .5, .9]))
+    x[:10] = np.nan
+    assert bins.size(x) == x.size - 10
+
+
+def test_quantile_sketch():
+    x = np.random.default_rng(2).uniform(size=10 ** 6)
+    s = bins.QuantileSketch(10 ** 5).update(x)
+    assert s.size == x.size and s.quantile(0) == x.min() and s.quantile(1) == x.max()
+    assert np.allclose(s.quantile([.1, .5, .9]), [.1, .5, .9], atol=.01)
+
+
+def test_find_after_inplace_change():
+    a = np.arange(100.)
+    e0 = bins.find(a)[1]
+    a *= 10
+    assert np.allclose(bins.find(a)[1], e0 * 10)
+    a[:] = np.arange(100.)
+    assert np.allclose(bins.find(a)[1], e0)
+
+
+def test_contents_1d():
+    x, w = np.random.default_rng(3).normal(size=(2, 10 ** 4))
+    e = np.linspace(-2, 2, 21)
+    c, s = bins.contents([e], x, w=w)[:2]
+    assert c.size == e.size + 1 and np.allclose(c[1:-1], np.histogram(x, e, weights=w)[0]) and np.allclose(s[1:-1], np.histogram(x, e, weights=w ** 2)[0])
+    assert np.isclose(c[0], w[x < -2].sum()) and np.isclose(c[-1], w[x >= 2].sum())
+
+
+def test_contents_2d():
+    x, y = np.random.default_rng(4).normal(size=(2, 10 ** 4))
+    ex, ey = np.linspace(-2, 2, 11), np.linspace(-1, 3, 6)
+    c = bins.contents([ex, ey], x, y)[0].reshape(ey.size + 1, ex.size + 1)
+    assert np.allclose(c[1:-1, 1:-1], np.histogram2d(x, y, [ex, ey])[0].T)
+
+
+def test_contents_profile():
+    x, z = np.random.default_rng(5).normal(size=(2, 10 ** 4))
+    e = np.linspace(-2, 2, 9)
+    wz, wz2, n = bins.contents([e], x, z, profile=True)[:3]
+    i = np.digitize(x, e)
+    assert np.allclose(n, np.bincount(i, minlength=e.size + 1)) and np.allclose(wz, np.bincount(i, z, e.size + 1)) and np.allclose(wz2, np.bincount(i, z ** 2, e.size + 1))
+
+
+def test_contents_shards():
+    x, w = np.random.default_rng(6).normal(size=(2, 3 * bins.ShardSize))
+    e = np.linspace(-3, 3, 61)
+    for a, b in zip(bins.contents([e], x, w=w), bins.contents([e], x, w=w, workers=3)):
+        assert a is b is None or np.allclose(a, b)
+
+
+def test_moments():
+    x, y, w = np.random.default_rng(7).normal(size=(3, 10 ** 4))
+    ex, ey = np.linspace(-2, 2, 11), np.linspace(-1, 3, 6)
+    cut = (x >= -2) & (x < 2) & (y >= -1) & (y < 3)
+    xc, yc, wc = x[cut], y[cut], w[cut]
+    s = bins.contents([ex, ey], x, y, w=w)[4]
+    assert np.allclose(s, [wc.sum(), wc @ wc, wc @ xc, wc @ xc ** 2, wc @ yc, wc @ yc ** 2, wc @ (xc * yc)])
+    s = bins.contents([ex], x, y, profile=True)[4]
+    c = (x >= -2) & (x < 2)
+    assert np.allclose(s, [c.sum(), c.sum(), x[c].sum(), (x[c] ** 2).sum(), y[c].sum(), (y[c] ** 2).sum()])
+
+
+def test_find_hashes_once(monkeypatch):
+    calls, key = [], bins.content_key
+    monkeypatch.setattr(bins, 'content_key', lambda x: calls.append(1) or key(x))
+    x = np.random.default_rng(8).normal(size=10 ** 4)
+    e = bins.find(x)[1]
+    assert len(calls) == 1 and np.allclose(bins.find(x)[1], e) and len(calls) == 2
+
+
+def test_memmap_key(tmp_path):
+    np.arange(10.).tofile(tmp_path.joinpath('a.bin'))
+    a = np.memmap(tmp_path.joinpath('a.bin'), 'd', 'r')
+    assert bins.content_key(a) == bins.content_key(a) != bins.content_key(a[1:]) and np.allclose(bins.find(a)[1], bins.find(np.arange(10.))[1])
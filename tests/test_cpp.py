@@ -0,0 +1,11 @@
+import pytest
+
+from rootplots import cpp
+
+
+def test_model_requires_pars():
+    with pytest.raises(TypeError):
+        cpp.model('[0] * x')(lambda x, a: a * x)
+    f = cpp.model(lambda n=1: f'[0] * x^{n}')(lambda x, pars, n=1: pars[0] * x ** n)
+    assert f in cpp.Models
+    cpp.Models.pop(f)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from uncertainties import ufloat
+
+pytest.importorskip('ROOT')
+from rootplots.draw import graph_columns, Draw, FitCache, FitRes, Registry  # noqa: E402
+
+
+def test_exports():
+    from rootplots import draw
+    assert all(hasattr(draw, name) for name in draw.__all__)
+
+
+def test_graph_columns():
+    a, asym = graph_columns([[1, .1], [2, .2, .3]])
+    assert asym and np.allclose(a, [[1, .1, 0], [2, .2, .3]])  # missing upper errors are 0
+    a, asym = graph_columns([ufloat(1, .1), ufloat(2, .2)])
+    assert not asym and np.allclose(a, [[1, .1, .1], [2, .2, .2]])
+    a, asym = graph_columns([])
+    assert a.shape == (0, 3) and not asym
+
+
+def test_fit_cache(tmp_path):
+    cache = FitCache(2, tmp_path)
+    res = cache.add('a', FitRes.from_values([1, 2], [.1, .2], ['c', 'm'], 3., 4))
+    assert res.Pars[1] == 2 and not res.is_tf1
+    cache.clear()
+    res = cache.get('a')  # restored from the directory
+    assert np.allclose(res.Pars, [1, 2]) and res.Errors == [.1, .2] and res.get_chi2() == .75 and not res.is_tf1
+
+
+def test_registry(monkeypatch):
+    from ROOT import TCanvas, TH1F
+    monkeypatch.setattr(Registry, 'hidden', staticmethod(lambda: False))
+    r, f = Registry(1), (lambda x: x)
+    c1 = TCanvas('registry_c1', '', 10, 10)
+    h = TH1F('registry_h', '', 1, 0, 1)
+    r.add(c1, h, f)
+    c2 = TCanvas('registry_c2', '', 10, 10)
+    r.add(c2)
+    assert 'registry_c1' in r.Groups  # the canvas is still shown
+    c1.Close()
+    r.add(c2)
+    assert 'registry_c1' not in r.Groups and 'registry_c2' in r.Groups and r.Callbacks[id(f)] is f
+
+
+def test_registry_headless(monkeypatch):
+    from ROOT import TCanvas, gROOT
+    monkeypatch.setattr(Draw, 'Headless', True)
+    r = Registry(2)
+    for i in range(5):
+        r.add(TCanvas(f'registry_hl{i}', '', 10, 10))
+    assert list(r.Groups) == ['registry_hl3', 'registry_hl4'] and not gROOT.GetListOfCanvases().FindObject('registry_hl0')
+
+
+def test_chunked():
+    from rootplots.draw import chunked
+    a, b = np.arange(5.), np.arange(5., 12)
+    (s,), chunks = chunked([a, b])
+    assert s.size == 12 and s.quantile(1) == 11 and [c[0].size for c in chunks] == [5, 7]
+    (x, y), chunks = chunked([a, b], [a, b], binning=[1, np.array([0., 1])])
+    assert x is None and len(list(chunks)) == 2
+    for v in [([a, 1.],), ([a, b], [a]), (iter([a]), a)]:
+        with pytest.raises(ValueError):
+            chunked(*v, binning=[1, np.array([0., 1])])
+    with pytest.raises(ValueError):
+        chunked(iter([a]))
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('ROOT')
+from rootplots.fit import landau, np_fit, gauss, gauss_jacobian, fit_batch  # noqa: E402
+
+
+def test_landau():
+    """ reference values of the Landau density p(x) = 1/pi int_0^inf exp(-t log t - x t) sin(pi t) dt (CERNLIB DENLAN) """
+    x = np.array([-3, -1, 0, 1, 3, 10, 50])
+    ref = [6.737286e-4, .1513919115, .1788541607, .1452066371, .0742476546, .0119764874, 4.4964947e-4]
+    assert np.allclose(landau(x), ref, rtol=1e-5)
+    assert np.allclose(landau(2 * x + 1, 1, 2), ref, rtol=1e-5)
+
+
+def test_landau_invalid_sigma():
+    with np.errstate(all='raise'):
+        assert np.all(landau(np.linspace(-5, 5, 11), 0, 0) == 0) and np.all(landau([1., 2.], 0, -1) == 0)
+
+
+def test_np_fit():
+    rng = np.random.default_rng(7)
+    x = np.linspace(-5, 5, 101)
+    y = rng.poisson(gauss(x, 200, .5, 1.2)).astype('d')
+    for lh in [False, True]:
+        for jac in [None, gauss_jacobian]:
+            p, e, chi2, ndf = np_fit(gauss, x, y, np.sqrt(y), [100, 0, 1], lh=lh, jac=jac)
+            assert np.allclose(p, [200, .5, 1.2], atol=4 * e) and np.all(e > 0) and ndf > 0
+
+
+def test_fit_batch():
+    x = np.linspace(-5, 5, 101)
+    y = np.array([gauss(x, 100, m, 1) for m in [-1, 0, 1]])
+    pars = fit_batch(gauss, x=x, y=y, ey=np.ones_like(y), p0=[80, 0, 1.5], workers=1)[0]
+    assert np.allclose(pars[:, 1], [-1, 0, 1], atol=1e-4)
+
+
+def test_scaled_poisson():
+    from rootplots.fit import scaled_poisson
+    from ROOT import TMath
+    for x in [0., .5, 1.5, 2.49, 2.5, 3.7]:
+        assert np.isclose(scaled_poisson(x, 2, 1.7), 2 * TMath.PoissonI(x, 1.7))
+
+
+def test_function_id():
+    from rootplots.fit import function_id
+    f = [lambda x, a: a * x, lambda x, a: a + x]
+    assert function_id(f[0]) != function_id(f[1]) and function_id(f[0]) == function_id(f[0])
+    assert function_id(lambda x: object()) is not None and function_id(lambda x, o=object(): x) is None
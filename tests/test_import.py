@@ -0,0 +1,28 @@
+import sys
+from subprocess import run
+
+MaxImportTime = .5  # s, the package itself must not import ROOT, scipy or screeninfo
+
+
+def import_times(module):
+    """ :returns: cumulative import time in s of each module imported by [module] from 'python -X importtime' """
+    out = run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True, text=True, check=True).stderr
+    rows = [line.split('|') for line in out.splitlines() if line.startswith('import time:') and 'cumulative' not in line]
+    return {name.strip(): int(cum) / 1e6 for _, cum, name in rows}
+
+
+def test_import_time():
+    t = import_times('rootplots')
+    assert t['rootplots'] < MaxImportTime
+    assert not {'ROOT', 'scipy', 'screeninfo'} & set(t)
+
+
+def test_lazy_submodules():
+    t = import_times('rootplots.binning')
+    assert 'ROOT' not in t
+
+
+def test_exports():
+    import rootplots
+    assert {'bins', 'Draw', 'format_histo', 'SaveDraw', 'export'} <= set(rootplots.__all__)
+    assert not {'np', 'Path', 'info', 'init_task'} & set(rootplots.__all__)
@@ -0,0 +1,48 @@
+import numpy as np
+from uncertainties import unumpy as unp
+
+from rootplots.utils import uarray, Config, Profiler
+
+
+def test_uarray_matches_ufloat():
+    u, v = uarray([1., 2, 3], [.1, .2, .3]), uarray([2., 1, 4], [.3, .1, .2])
+    uu, vv = unp.uarray(u.n, u.s), unp.uarray(v.n, v.s)
+    for a, b in [(u + v, uu + vv), (u - v, uu - vv), (u * v, uu * vv), (u / v, uu / vv), (u ** 2, uu ** 2), (2 / u, 2 / uu)]:
+        assert np.allclose(a.n, unp.nominal_values(b)) and np.allclose(a.s, unp.std_devs(b))
+
+
+def test_uarray_identical_operands():
+    u = uarray([1., 2, 3], [.1, .2, .3])
+    uu = unp.uarray(u.n, u.s)
+    for a, b in [(u - u, uu - uu), (u / u, uu / uu), (u + u, uu + uu), (u * u, uu * uu)]:
+        assert np.allclose(a.n, unp.nominal_values(b)) and np.allclose(a.s, unp.std_devs(b))
+
+
+def test_config_cache(tmp_path):
+    f = tmp_path.joinpath('c.json')
+    f.write_text('{"A": {"x": 1, "y": 2}}')
+    c = Config(f, from_json=True, watch=True)
+    assert c.get_value('A', 'x', int) == 1 and c.get_value('A', 'y', default=0) == 2
+    c.remove_option('A', 'y')
+    assert c.get_value('A', 'y', default=0) == 0
+    c.reload()
+    assert c.get_value('A', 'y', default=0) == 2
+    c.read_dict({'A': {'x': 3}})
+    assert c.get_value('A', 'x', int) == 3
+
+
+def test_profiler_merge():
+    p, worker = Profiler(active=True), Profiler(active=True)
+    p.add('draw', .5)
+    worker.add('draw', .25, 2)
+    worker.add('save pdf', 1.)
+    p.merge(worker.Data, {'save pdf': [1, 1.]})
+    assert p.Data == {'draw': [3, .75], 'save pdf': [2, 2.]}
+
+
+def test_uarray_ufuncs():
+    u = uarray([1., -5, 3], [.1, .2, .3])
+    assert np.max(u).n == 3 and np.min(u).s == .2 and np.argmax(u) == 2 and np.all(np.isfinite(u))
+    assert np.allclose(np.abs(u).n, [1, 5, 3]) and np.allclose((np.ones(3) + u).s, u.s) and np.allclose((np.arange(3.) < u), [True, False, True])
+    m = uarray([[1., 5], [3, 2]], [[.1, .5], [.3, .2]])
+    assert np.allclose(np.max(m, axis=0).s, [.3, .5]) and np.allclose(m.min(axis=1).n, [1, 2])